@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Allocations per command on the receive path: recv() +
+CommandResponse.fromstring() versus ReceiveBuffer + ResponseView.
+
+The socket is replaced by an in-memory reply so only the receive and
+parse steps are measured, which run unchanged on Python 2.7 and 3.
+Transient bytes allocated per command (peak traced memory while the
+command is handled) need tracemalloc: in the standard library from
+Python 3.4, and available for 2.7 only as the pytracemalloc backport on
+a patched interpreter. Without it, the bytes/command column is "-" and
+only the time per command is reported.
+
+  PYTHONPATH=. python bench/bench_receive.py [commands]
+
+"""
+
+import sys
+import time
+
+from pySTR4500.client import *
+from pySTR4500.buffers import *
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+REPLY = b"<msg><status>4</status><data>3600</data></msg>"
+
+class CannedSocket(object):
+  """
+  Socket stand-in that replies with REPLY.
+  """
+
+  def recv(self, size):
+    return REPLY[:size]
+
+  def recv_into(self, view):
+    n = len(REPLY)
+    view[:n] = REPLY
+    return n
+
+def baseline(sock):
+  def step():
+    r = CommandResponse.fromstring(sock.recv(BUFFER_SIZE))
+    r.status
+  return step
+
+def in_place(sock):
+  buf = ReceiveBuffer()
+  def step():
+    r = buf.recv(sock)
+    r.status
+  return step
+
+def in_place_data(sock):
+  buf = ReceiveBuffer()
+  def step():
+    r = buf.recv(sock)
+    r.status
+    r.data
+  return step
+
+def measure(make_step, n):
+  step = make_step(CannedSocket())
+  for _ in range(100):
+    step()
+  start = time.time()
+  for _ in range(n):
+    step()
+  elapsed = time.time() - start
+  transient = None
+  if tracemalloc is not None:
+    # Restarting tracing per sample resets the peak, which works on
+    # every tracemalloc version (reset_peak() is 3.9+ only).
+    samples = min(n, 1000)
+    transient = 0
+    for _ in range(samples):
+      tracemalloc.start()
+      current, _ = tracemalloc.get_traced_memory()
+      step()
+      _, peak = tracemalloc.get_traced_memory()
+      tracemalloc.stop()
+      transient += peak - current
+    transient = float(transient) / samples
+  return elapsed, transient
+
+def main(argv):
+  n = int(argv[1]) if len(argv) > 1 else 10000
+  sys.stdout.write("%-28s %12s %16s\n" % ("path", "us/command",
+                                          "bytes/command"))
+  for name, fn in [("recv + fromstring", baseline),
+                   ("ResponseView (status)", in_place),
+                   ("ResponseView (status+data)", in_place_data)]:
+    elapsed, transient = measure(fn, n)
+    transient = "-" if transient is None else "%.0f" % transient
+    sys.stdout.write("%-28s %12.2f %16s\n" % (name, 1e6 * elapsed / n,
+                                              transient))
+  if tracemalloc is None:
+    sys.stdout.write("bytes/command needs tracemalloc (Python 3.4+, or "
+                     "pytracemalloc on 2.7).\n")
+
+if __name__ == "__main__":
+  main(sys.argv)
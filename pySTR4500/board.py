@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Shared-memory device status board for multi-process controllers.
+
+One BoardPoller per host polls status() and time() and publishes the
+scenario state, run time, last error and heartbeat latency into a
+fixed-layout slot of a memory-mapped file. Any number of local
+processes open the same file and read slots without locks or network
+traffic:
+
+  # In the poller process:
+  board = StatusBoard("/dev/shm/str4500.board", create=True)
+  BoardPoller(STR4500("192.168.1.209"), board).start()
+
+  # In any worker process:
+  board = StatusBoard("/dev/shm/str4500.board")
+  entry = board.find("192.168.1.209", 15650)
+  if entry.state == "Running": ...
+
+Each slot is guarded by a sequence counter (a seqlock): the writer
+makes it odd while updating, and readers retry until they see the same
+even value before and after copying the slot.
+
+"""
+
+import mmap
+import struct
+import threading
+import time
+
+from pySTR4500.client import *
+
+MAGIC = b"STRB"
+VERSION = 1
+# magic, version, number of slots, slot size.
+HEADER = struct.Struct("<4sHHI")
+# seq, port, host, state code, run time, heartbeat time, heartbeat
+# latency, last error.
+SLOT = struct.Struct("<IH64sBxddd128s")
+SLOT_SIZE = 256
+STATE_UNKNOWN = 0xff
+
+def _text(value):
+  """
+  Coerce a byte or unicode string to unicode.
+  """
+  if isinstance(value, bytes):
+    return value.decode("utf-8", "replace")
+  return value
+
+def _encode(value, size):
+  """
+  Encode text as UTF-8 in at most size bytes, cutting on a character
+  boundary.
+  """
+  encoded = _text(value or u"").encode("utf-8")[:size]
+  return encoded.decode("utf-8", "ignore").encode("utf-8")
+
+def _describe(e):
+  try:
+    message = unicode(e)
+  except UnicodeError:
+    message = _text(str(e))
+  return u"%s: %s" % (type(e).__name__, message)
+
+class StatusEntry(object):
+  """
+  Snapshot of one device's published status.
+  """
+
+  def __init__(self, host, port, state, run_time, heartbeat, latency, error):
+    self.host = host
+    self.port = port
+    self.state = state
+    self.run_time = run_time
+    self.heartbeat = heartbeat
+    self.latency = latency
+    self.error = error
+
+  def __eq__(self, other):
+    return self.__dict__ == other.__dict__
+
+  def __repr__(self):
+    val = (self.host, self.port, self.state, self.run_time, self.latency,
+           self.error)
+    formatted = "<StatusEntry (host = %s, port = %s, state = %s, " \
+                "run_time = %s, latency = %s, error = %s)>"
+    return formatted % val
+
+  def age(self):
+    """
+    Seconds since the poller last heard from the device.
+    """
+    return time.time() - self.heartbeat
+
+class StatusBoard(object):
+  """
+  Memory-mapped table of StatusEntry slots.
+
+  Parameters
+  ----------
+  path : str
+    Backing file. Put it on a tmpfs (e.g. /dev/shm) to keep it in
+    memory.
+  slots : int, optional
+    Number of slots, when creating. Defaults to 64.
+  create : bool, optional
+    Create (or reset) the file; only the writing process should.
+    Defaults to False.
+
+  Returns
+  ----------
+  board : StatusBoard
+
+  """
+
+  def __init__(self, path, slots=64, create=False):
+    self.path = path
+    if create:
+      with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, slots, SLOT_SIZE))
+        f.write(b"\0" * (SLOT_SIZE - HEADER.size + slots * SLOT_SIZE))
+    with open(path, "r+b" if create else "rb") as f:
+      access = mmap.ACCESS_WRITE if create else mmap.ACCESS_READ
+      self._map = mmap.mmap(f.fileno(), 0, access=access)
+    magic, version, self.slots, size = HEADER.unpack_from(self._map, 0)
+    if magic != MAGIC or version != VERSION or size != SLOT_SIZE:
+      raise RuntimeError("Invalid status board: %s" % path)
+    self._lock = threading.Lock()
+
+  def __repr__(self):
+    return "<StatusBoard (path = %s, slots = %s)>" % (self.path, self.slots)
+
+  def close(self):
+    self._map.close()
+
+  def _offset(self, slot):
+    if not 0 <= slot < self.slots:
+      raise ValueError("Invalid slot.")
+    return SLOT_SIZE * (slot + 1)
+
+  def read(self, slot, retries=1000):
+    """
+    Read a slot without locking.
+
+    Returns
+    -------
+    entry : StatusEntry
+      Or None if the slot is unused.
+
+    """
+    offset = self._offset(slot)
+    for _ in xrange(retries):
+      seq = struct.unpack_from("<I", self._map, offset)[0]
+      if seq & 1:
+        continue
+      fields = SLOT.unpack_from(self._map, offset)
+      # A writer that started during the copy has moved seq on.
+      if struct.unpack_from("<I", self._map, offset)[0] != seq:
+        continue
+      if seq == 0:
+        return None
+      _, port, host, state, run_time, heartbeat, latency, error = fields
+      return StatusEntry(host.rstrip(b"\0").decode("utf-8", "replace"), port,
+                         STATUS_VALUES.get(state),
+                         None if run_time != run_time else run_time,
+                         heartbeat, latency,
+                         error.rstrip(b"\0").decode("utf-8", "replace")
+                         or None)
+    raise RuntimeError("Status board slot %d is not settling." % slot)
+
+  def entries(self):
+    """
+    Get all used slots, as {slot: StatusEntry}.
+    """
+    entries = {}
+    for slot in xrange(self.slots):
+      entry = self.read(slot)
+      if entry is not None:
+        entries[slot] = entry
+    return entries
+
+  def find(self, host, port):
+    """
+    Get the entry for a device, or None.
+    """
+    for entry in self.entries().itervalues():
+      if (entry.host, entry.port) == (host, port):
+        return entry
+    return None
+
+  def claim(self, host, port):
+    """
+    Get the slot for a device, taking a free one if it has none.
+    Writer side only.
+    """
+    with self._lock:
+      free = None
+      for slot in xrange(self.slots):
+        entry = self.read(slot)
+        if entry is None:
+          free = slot if free is None else free
+        elif (entry.host, entry.port) == (host, port):
+          return slot
+      if free is None:
+        raise RuntimeError("Status board is full.")
+      self.write(free, host, port, heartbeat=0.0)
+      return free
+
+  def write(self, slot, host, port, state=None, run_time=None,
+            latency=float('nan'), error=None, heartbeat=None):
+    """
+    Publish a device's status. Each slot must have a single writer.
+    heartbeat (time of the last reply from the device) defaults to now.
+    """
+    offset = self._offset(slot)
+    seq = struct.unpack_from("<I", self._map, offset)[0]
+    # Make seq odd before touching the payload, and even again after.
+    struct.pack_into("<I", self._map, offset, seq + 1)
+    SLOT.pack_into(self._map, offset, seq + 1, port,
+                   _encode(host, 64),
+                   STATUS_CODES.get(state, STATE_UNKNOWN),
+                   float('nan') if run_time is None else run_time,
+                   time.time() if heartbeat is None else heartbeat, latency,
+                   _encode(error, 128))
+    struct.pack_into("<I", self._map, offset, seq + 2)
+
+class BoardPoller(object):
+  """
+  Polls one STR4500 and publishes its status to a StatusBoard.
+
+  Parameters
+  ----------
+  dev : STR4500
+    Controller for the device. Its handler must be blocking.
+  board : StatusBoard
+    Board opened with create=True.
+  interval : float, optional
+    Seconds between polls. Defaults to 1.0.
+
+  Returns
+  ----------
+  poller : BoardPoller
+
+  """
+
+  def __init__(self, dev, board, interval=1.0):
+    self.dev = dev
+    self.board = board
+    self.interval = interval
+    self.slot = board.claim(dev.host, dev.port)
+    self._state = None
+    self._run_time = None
+    self._heartbeat = 0.0
+    self._stop = threading.Event()
+    self._thread = None
+
+  def __repr__(self):
+    val = (self.dev.host, self.dev.port, self.slot)
+    formatted = "<BoardPoller (host = %s, port = %s, slot = %s)>"
+    return formatted % val
+
+  def poll(self):
+    """
+    Poll the device once and publish the result.
+    """
+    error = None
+    latency = float('nan')
+    try:
+      start = time.time()
+      self._state = self.dev.status().status
+      self._heartbeat = time.time()
+      latency = self._heartbeat - start
+      if self._state in ("Running", "Paused", "Ended"):
+        self._run_time = self.dev.time()
+    except Exception as e:
+      error = _describe(e)
+    self.board.write(self.slot, self.dev.host, self.dev.port, self._state,
+                     self._run_time, latency, error, self._heartbeat)
+
+  def start(self):
+    """
+    Poll in a background thread until stop().
+    """
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def _run(self):
+    while not self._stop.is_set():
+      self.poll()
+      self._stop.wait(self.interval)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Low-allocation receive path for high-rate polling.
+
+dispatch() allocates a new string per recv, and
+CommandResponse.fromstring() builds an element tree from it. Here,
+replies are read with recv_into() into a preallocated ReceiveBuffer
+(one per I/O thread, since SimPLEX takes one command per connection),
+and a ResponseView locates the status and data fields in place. The
+status maps straight onto STATUS_VALUES; data is only copied out when
+read.
+
+  view = handle_view(host, port, ["TIME"])
+  if view.status == "Running":
+    t = int(view.data)
+
+A view is only valid until the next reply is received into the same
+buffer; call freeze() to keep a CommandResponse. Hosts with a
+registered transport, and every host while a command log is set, go
+through handle() instead, since both work on reply strings.
+
+"""
+
+import socket
+import threading
+
+from pySTR4500 import client
+from pySTR4500.client import *
+
+_MSG_END = b"</msg>"
+_STATUS = (b"<status>", b"</status>")
+_DATA = (b"<data>", b"</data>")
+_ERROR = b"<error>"
+
+class ReceiveBuffer(object):
+  """
+  Reusable receive buffer.
+
+  Parameters
+  ----------
+  size : int, optional
+    Initial capacity, bytes. Doubled if a reply does not fit. Defaults
+    to BUFFER_SIZE.
+
+  Returns
+  ----------
+  buf : ReceiveBuffer
+
+  """
+
+  def __init__(self, size=BUFFER_SIZE):
+    self.data = bytearray(size)
+    self.view = memoryview(self.data)
+    self.length = 0
+    self.generation = 0
+
+  def __repr__(self):
+    val = (len(self.data), self.length)
+    formatted = "<ReceiveBuffer (size = %s, length = %s)>"
+    return formatted % val
+
+  def recv(self, sock):
+    """
+    Read one reply from sock, until "</msg>" or the peer closes.
+
+    Parameters
+    ----------
+    sock : socket.socket
+      Connected socket.
+
+    Returns
+    ----------
+    view : ResponseView
+
+    """
+    self.generation += 1
+    n = 0
+    while True:
+      if n == len(self.data):
+        grown = bytearray(2 * len(self.data))
+        grown[:n] = self.view[:n]
+        self.data, self.view = grown, memoryview(grown)
+      read = sock.recv_into(self.view[n:])
+      if not read:
+        break
+      n += read
+      if self.data.find(_MSG_END, max(0, n - read - len(_MSG_END)), n) >= 0:
+        break
+    self.length = n
+    return ResponseView(self)
+
+class ResponseView(CommandResponse):
+  """
+  STR4500 reply parsed in place in a ReceiveBuffer.
+
+  Has the status and data attributes of a CommandResponse, and raises
+  the same errors on construction. Replies the in-place scanner does
+  not handle (entities, nested markup) fall back to
+  CommandResponse.fromstring().
+
+  Parameters
+  ----------
+  buf : ReceiveBuffer
+    Buffer holding a complete reply.
+
+  Returns
+  ----------
+  view : ResponseView
+
+  """
+
+  def __init__(self, buf):
+    self._buf = buf
+    self._generation = buf.generation
+    self._response = None
+    self._data = None
+    data, n = buf.data, buf.length
+    if n == 0:
+      self._response = CommandResponse()
+      return
+    start = data.find(_STATUS[0], 0, n)
+    end = data.find(_STATUS[1], start, n)
+    if start < 0 or end < 0 or data.find(_ERROR, 0, n) >= 0 \
+       or data.find(b"&", 0, n) >= 0:
+      self._response = CommandResponse.fromstring(buf.view[:n].tobytes())
+      return
+    code = 0
+    i = start + len(_STATUS[0])
+    while i < end:
+      digit = data[i] - 48
+      if not 0 <= digit <= 9:
+        raise RuntimeError("Invalid STR4500 status.")
+      code = 10 * code + digit
+      i += 1
+    try:
+      self._status = STATUS_VALUES[code]
+    except KeyError:
+      raise RuntimeError("Invalid STR4500 status.")
+    self._data_start = data.find(_DATA[0], 0, n)
+    self._data_end = -1
+    if self._data_start >= 0:
+      self._data_start += len(_DATA[0])
+      self._data_end = data.find(_DATA[1], self._data_start, n)
+      if self._data_end < 0 or \
+         data.find(b"<", self._data_start, self._data_end) >= 0:
+        self._response = CommandResponse.fromstring(buf.view[:n].tobytes())
+
+  def __eq__(self, other):
+    return (self.status, self.data) == (other.status, other.data)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __repr__(self):
+    val = (self.status, self.data)
+    formatted = "<ResponseView (status = %s, data = %s)>"
+    return formatted % val
+
+  def _check(self):
+    if self._buf.generation != self._generation:
+      raise RuntimeError("ResponseView used after its buffer was reused.")
+
+  @property
+  def status(self):
+    if self._response is not None:
+      return self._response.status
+    return self._status
+
+  @property
+  def data(self):
+    if self._response is not None:
+      return self._response.data
+    if self._data is None and self._data_end > self._data_start:
+      self._check()
+      data = self._buf.view[self._data_start:self._data_end].tobytes()
+      self._data = data if str is bytes else data.decode()
+    return self._data
+
+  def freeze(self):
+    """
+    Copy out a CommandResponse that outlives the buffer.
+    """
+    if self._response is not None:
+      return self._response
+    return CommandResponse(self.status, self.data)
+
+_local = threading.local()
+
+def dispatch_view(host, port, msg, buf=None):
+  """
+  Blocking I/O to the socket, receiving into a reusable buffer.
+
+  Parameters
+  ----------
+  host : str
+    IPv4 address or hostname.
+  port : int
+    SimPLEX port.
+  msg : str
+    Command string
+  buf : ReceiveBuffer, optional
+    Buffer to receive into. Defaults to one per calling thread.
+
+  Returns
+  ----------
+  view : ResponseView
+
+  """
+  if buf is None:
+    buf = getattr(_local, 'buf', None)
+    if buf is None:
+      buf = _local.buf = ReceiveBuffer()
+  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  try:
+    sock.connect((host, port))
+    sock.setblocking(1)
+    sock.sendall(msg)
+    return buf.recv(sock)
+  finally:
+    sock.close()
+
+def handle_view(host, port, cmd, buf=None):
+  """
+  Given a command tuple, encode, issue, and decode in place. May be
+  used as a STR4500 handler when responses are read before the next
+  command on the same thread.
+
+  Commands for a host with a registered transport (TRANSPORTS), and
+  all commands while a COMMAND_LOG is set, are passed to handle()
+  instead, so they are routed and logged like any other command.
+
+  Returns
+  ----------
+  view : ResponseView or CommandResponse
+
+  """
+  if client.COMMAND_LOG is not None or (host, port) in TRANSPORTS:
+    return handle(host, port, cmd)
+  return dispatch_view(host, port, encode(cmd), buf)
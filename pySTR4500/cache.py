@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Shared cache for read-only queries.
+
+Components that each poll status(), time() and scenario_duration() on
+the same device can share one QueryCache:
+
+  cache = QueryCache()
+  dev = STR4500("192.168.1.209", handler=cache.handle)
+
+Cached replies are invalidated by the commands that change them:
+scenario control (SC, RU, EN, RW, TR) invalidates status and time, and
+SC also invalidates the scenario duration. While a scenario is Running,
+time is extrapolated from the last reply. Concurrent identical queries
+share a single round-trip.
+
+"""
+
+import threading
+import time
+
+from pySTR4500.client import *
+from pySTR4500.futures import CommandFuture
+
+# Queries invalidated by each scenario control command.
+INVALIDATES = {
+  "SC" : ("NULL", "TIME", "SC_DURATION"),
+  "RU" : ("NULL", "TIME"),
+  "EN" : ("NULL", "TIME"),
+  "RW" : ("NULL", "TIME"),
+  "TR" : ("NULL", "TIME")
+}
+
+class QueryCache(object):
+  """
+  TTL cache for NULL (status), TIME and SC_DURATION queries, in front
+  of client.handle().
+
+  Parameters
+  ----------
+  handler : callable, optional
+    Called as handler(host, port, cmd) on a miss or for any other
+    command. Must be blocking. Defaults to handle().
+  status_ttl : float, optional
+    Seconds a status reply is reused. Scenarios can end on their own,
+    so this bounds how stale "Running" may be. Defaults to 1.0.
+  time_ttl : float, optional
+    Seconds a time reply is reused (extrapolated while Running).
+    Defaults to 1.0.
+  duration_ttl : float, optional
+    Seconds a scenario duration is reused. Defaults to None (until the
+    next select_scenario).
+
+  Returns
+  ----------
+  cache : QueryCache
+
+  """
+
+  def __init__(self, handler=None, status_ttl=1.0, time_ttl=1.0,
+               duration_ttl=None):
+    self.handler = handler or handle
+    self.ttls = {"NULL" : status_ttl, "TIME" : time_ttl,
+                 "SC_DURATION" : duration_ttl}
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self.invalidations = 0
+    self._entries = {}
+    self._inflight = {}
+    self._generations = {}
+    self._lock = threading.Lock()
+
+  def __repr__(self):
+    val = (self.hits, self.misses, self.coalesced)
+    formatted = "<QueryCache (hits = %s, misses = %s, coalesced = %s)>"
+    return formatted % val
+
+  def stats(self):
+    """
+    Get hit/miss statistics.
+
+    Returns
+    -------
+    stats : dict
+      hits, misses, coalesced (queries that waited on an identical
+      in-flight query), invalidations and hit_rate.
+
+    """
+    with self._lock:
+      total = self.hits + self.misses + self.coalesced
+      return {'hits' : self.hits, 'misses' : self.misses,
+              'coalesced' : self.coalesced,
+              'invalidations' : self.invalidations,
+              'hit_rate' : float(self.hits + self.coalesced) / total
+                           if total else 0.0}
+
+  def invalidate(self, host, port, queries=QUERIES):
+    """
+    Drop cached replies for a host.
+    """
+    with self._lock:
+      self.invalidations += 1
+      generation = self._generations.get((host, port), 0)
+      self._generations[(host, port)] = generation + 1
+      for query in queries:
+        self._entries.pop((host, port, query), None)
+
+  def handle(self, host, port, cmd):
+    """
+    Issue a command, answering queries from the cache when fresh.
+
+    Returns
+    ----------
+    response : CommandResponse
+
+    """
+    name = mnemonic(cmd)
+    if name not in QUERIES:
+      queries = INVALIDATES.get(name)
+      if queries is None:
+        return self.handler(host, port, cmd)
+      self.invalidate(host, port, queries)
+      try:
+        return self.handler(host, port, cmd)
+      finally:
+        self.invalidate(host, port, queries)
+    key = (host, port, name)
+    owner = False
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        response = self._fresh(name, entry)
+        if response is not None:
+          self.hits += 1
+          return response
+      future = self._inflight.get(key)
+      if future is not None:
+        self.coalesced += 1
+      else:
+        self.misses += 1
+        future = self._inflight[key] = CommandFuture()
+        generation = self._generations.get((host, port), 0)
+        owner = True
+    if not owner:
+      return future.result()
+    try:
+      response = self.handler(host, port, cmd)
+    except Exception as e:
+      with self._lock:
+        del self._inflight[key]
+      future.set_exception(e)
+      raise
+    with self._lock:
+      del self._inflight[key]
+      if self._generations.get((host, port), 0) == generation:
+        self._entries[key] = (response, time.time())
+    future.set_result(response)
+    return response
+
+  def _fresh(self, name, entry):
+    response, fetched = entry
+    age = time.time() - fetched
+    ttl = self.ttls[name]
+    if ttl is not None and age > ttl:
+      return None
+    if name == "TIME" and response.status == "Running":
+      try:
+        return CommandResponse(response.status,
+                               str(int(float(response.data) + age)))
+      except (TypeError, ValueError):
+        pass
+    return response
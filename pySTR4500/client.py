@@ -30,6 +30,7 @@ access to certain virtual resources (scenarios, GPS satellites, etc.).
 """
 
 import socket
+import time
 import xml.etree.ElementTree as ET
 
 BUFFER_SIZE = 4096
@@ -43,7 +44,20 @@ STATUS_VALUES = {
   0x05 : "Paused",
   0x06 : "Ended"
 }
+# Status code of each state, the reverse of STATUS_VALUES.
+STATUS_CODES = dict((v, k) for k, v in STATUS_VALUES.iteritems())
 VEHICLE_ANTENNA = "v1_a1"
+# Commands whose first field is a timestamp ("-" or time into run).
+TIMESTAMPED_COMMANDS = ("POW_ON", "POW_MODE", "POW_LEV", "PRN_CODE", "EN")
+# Read-only queries.
+QUERIES = ("NULL", "TIME", "SC_DURATION")
+# Key for all-channel settings in power and PRN tables.
+ALL = "all"
+# Optional structured command log (see pySTR4500.timing.CommandLog).
+COMMAND_LOG = None
+# In-process transports by (host, port), used by handle() instead of
+# dispatch() (see register_transport).
+TRANSPORTS = {}
 
 class CommandResponse(object):
   """
@@ -119,7 +133,135 @@ def encode(cmd):
   """
   return ','.join(map(str, cmd))
 
-def dispatch(host, port, msg):
+def format_timestamp(seconds):
+  """
+  Format a time into run as a command timestamp.
+
+  Parameters
+  ----------
+  seconds : float
+    Time into run, seconds.
+
+  Returns
+  ----------
+  timestamp : str
+    Timestamp of the form "d hh:mm:ss" (e.g. "0 00:05:00"), with a
+    ".mmm" millisecond suffix for fractional times.
+
+  """
+  ms = int(round(seconds * 1000))
+  s, ms = divmod(ms, 1000)
+  m, s = divmod(s, 60)
+  h, m = divmod(m, 60)
+  d, h = divmod(h, 24)
+  timestamp = "%d %02d:%02d:%02d" % (d, h, m, s)
+  return timestamp + ".%03d" % ms if ms else timestamp
+
+def parse_timestamp(timestamp):
+  """
+  Parse a command timestamp into seconds into run.
+
+  Parameters
+  ----------
+  timestamp : str
+    Timestamp of the form "d hh:mm:ss[.mmm]", or "-".
+
+  Returns
+  ----------
+  seconds : float
+    Time into run, or None for "-" (apply when received).
+
+  """
+  if timestamp == "-":
+    return None
+  try:
+    d, hms = timestamp.split(" ")
+    h, m, s = hms.split(":")
+    return ((int(d) * 24 + int(h)) * 60 + int(m)) * 60 + float(s)
+  except ValueError:
+    raise ValueError("Invalid timestamp: %s" % timestamp)
+
+def mnemonic(cmd):
+  """
+  Get the SimPLEX mnemonic of a command vector, skipping the leading
+  timestamp of timestamped commands.
+
+  Parameters
+  ----------
+  cmd : [str]
+    Vector of command parameters.
+
+  Returns
+  ----------
+  mnemonic : str
+    For example, "POW_LEV" or "NULL".
+
+  """
+  if len(cmd) > 1 and cmd[1] in TIMESTAMPED_COMMANDS:
+    return cmd[1]
+  return cmd[0]
+
+def set_setting(table, key, all_chans, value):
+  """
+  Record a power, mode, level or PRN setting in a table keyed by
+  channel/satellite ID. An all-channel setting replaces every entry
+  with one under ALL.
+
+  Parameters
+  ----------
+  table : dict
+    Settings by channel/satellite ID, or ALL.
+  key : int or str
+    Channel/satellite ID, used as given.
+  all_chans : int
+    1 if the setting applies to all channels.
+  value : object
+    Setting to record.
+
+  """
+  if all_chans:
+    table.clear()
+    table[ALL] = value
+  else:
+    table[key] = value
+
+def set_command_log(log):
+  """
+  Install (or, with None, remove) a structured log that handle()
+  records every command to.
+
+  Parameters
+  ----------
+  log : CommandLog
+    Object with a record(**fields) method, e.g.
+    pySTR4500.timing.CommandLog.
+
+  """
+  global COMMAND_LOG
+  COMMAND_LOG = log
+
+def register_transport(host, port, transport):
+  """
+  Route commands for (host, port) through an in-process transport
+  instead of a socket (or, with None, restore the socket).
+
+  Parameters
+  ----------
+  host : str
+    Host name the transport answers for, e.g. "virtual".
+  port : int
+    Port the transport answers for.
+  transport : callable
+    Called like dispatch(host, port, msg, timings), returning an XML
+    response string, e.g. pySTR4500.virtual.VirtualDevice.dispatch.
+
+  """
+  if transport is None:
+    TRANSPORTS.pop((host, port), None)
+  else:
+    TRANSPORTS[(host, port)] = transport
+
+def dispatch(host, port, msg, timings=None):
   """
   Blocking I/O to the socket.
 
@@ -133,6 +275,9 @@ def dispatch(host, port, msg):
     STR4500 Simplex socket is actually hardwired to port 15650 :( .
   msg : str
     Command string
+  timings : dict, optional
+    If given, filled with the connect, send and recv durations in
+    seconds.
 
   Returns
   ----------
@@ -143,10 +288,22 @@ def dispatch(host, port, msg):
   sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
   sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
   try:
+    if timings is None:
+      sock.connect((host, port))
+      sock.setblocking(1)
+      sock.sendall(msg)
+      return sock.recv(BUFFER_SIZE)
+    start = time.time()
     sock.connect((host, port))
     sock.setblocking(1)
+    sent = time.time()
+    timings['connect'] = sent - start
     sock.sendall(msg)
-    return sock.recv(BUFFER_SIZE)
+    received = time.time()
+    timings['send'] = received - sent
+    response = sock.recv(BUFFER_SIZE)
+    timings['recv'] = time.time() - received
+    return response
   finally:
     sock.close()
 
@@ -170,7 +327,28 @@ def handle(host, port, cmd):
   response : CommandResponse
 
   """
-  return CommandResponse.fromstring(dispatch(host, port, encode(cmd)))
+  send = TRANSPORTS.get((host, port), dispatch) if TRANSPORTS else dispatch
+  if COMMAND_LOG is None:
+    return CommandResponse.fromstring(send(host, port, encode(cmd)))
+  timings = {}
+  start = time.time()
+  status, error = None, None
+  try:
+    reply = send(host, port, encode(cmd), timings)
+    parsed = time.time()
+    try:
+      response = CommandResponse.fromstring(reply)
+    finally:
+      timings['parse'] = time.time() - parsed
+    status = response.status
+    return response
+  except Exception as e:
+    error = "%s: %s" % (type(e).__name__, e)
+    raise
+  finally:
+    COMMAND_LOG.record(t=start, host=host, port=port, mnemonic=mnemonic(cmd),
+                       args=map(str, cmd), status=status, error=error,
+                       total=time.time() - start, **timings)
 
 class Channel(object):
   """
@@ -180,9 +358,10 @@ class Channel(object):
   is_chan = int(True)
   all_chans = int(False)
 
-  def __init__(self, host, port):
+  def __init__(self, host, port, handler=None):
     self.host = host
     self.port = port
+    self.handler = handler or handle
 
   @staticmethod
   def is_valid(chan):
@@ -213,7 +392,7 @@ class Channel(object):
       raise ValueError("Invalid channel value.")
     cmd = [timestamp, "POW_ON", VEHICLE_ANTENNA, int(on), chan,
            Channel.is_chan, Channel.all_chans]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_power_mode(self, chan, mode, timestamp="-"):
     """
@@ -240,7 +419,7 @@ class Channel(object):
       raise ValueError("Invalid channel value.")
     cmd = [timestamp, "POW_MODE", VEHICLE_ANTENNA, mode, chan,
            Channel.is_chan, Channel.all_chans]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_power_level(self, chan, level, absolute, timestamp="-"):
     """
@@ -269,7 +448,7 @@ class Channel(object):
       raise ValueError("Invalid channel value.")
     cmd = [timestamp, "POW_LEV", VEHICLE_ANTENNA, level, chan, Channel.is_chan,
            Channel.all_chans, int(absolute)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_prn(self, chan, on, timestamp="-"):
     """
@@ -294,7 +473,7 @@ class Channel(object):
     if not Channel.is_valid(chan):
       raise ValueError("Invalid channel value.")
     cmd = [timestamp, "PRN_CODE", chan, Channel.all_chans, int(on)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
 class Satellite(object):
   """
@@ -304,9 +483,10 @@ class Satellite(object):
   is_chan = int(True)
   all_chans = int(False)
 
-  def __init__(self, host, port):
+  def __init__(self, host, port, handler=None):
     self.host = host
     self.port = port
+    self.handler = handler or handle
 
   @staticmethod
   def is_valid(sat):
@@ -335,7 +515,7 @@ class Satellite(object):
     """
     cmd = [timestamp, "POW_ON", VEHICLE_ANTENNA, int(on), sat,
            Satellite.is_chan, Satellite.all_chans]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_power_mode(self, sat, mode, timestamp="-"):
     """
@@ -362,7 +542,7 @@ class Satellite(object):
       raise ValueError("Invalid satellite value.")
     cmd = [timestamp, "POW_MODE", VEHICLE_ANTENNA, mode, sat,
            Satellite.is_chan, Satellite.all_chans]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_power_level(self, sat, level, absolute, timestamp="-"):
     """
@@ -391,7 +571,7 @@ class Satellite(object):
       raise ValueError("Invalid satellite value.")
     cmd = [timestamp, "POW_LEV", VEHICLE_ANTENNA, level, sat, Satellite.is_chan,
            Satellite.all_chans, int(absolute)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
 class STR4500(object):
   """
@@ -405,6 +585,10 @@ class STR4500(object):
     localhost.
   port : int
     STR4500 Simplex socket is actually hardwired to port 15650 :( .
+  handler : callable, optional
+    Called as handler(host, port, cmd) to issue each command. Defaults
+    to handle(); pass e.g. CommandScheduler.handle to route commands
+    through a scheduler.
 
   Returns
   ----------
@@ -416,13 +600,14 @@ class STR4500(object):
   is_chan = int(True)
   all_chans = int(True)
 
-  def __init__(self, host="127.0.0.1", port=15650):
+  def __init__(self, host="127.0.0.1", port=15650, handler=None):
     self.host = host
     self.port = port
+    self.handler = handler or handle
     # Issue a status check for network connection.
     self.connected = self.status() is not None
-    self.chan = Channel(self.host, self.port)
-    self.sat = Satellite(self.host, self.port)
+    self.chan = Channel(self.host, self.port, self.handler)
+    self.sat = Satellite(self.host, self.port, self.handler)
 
   def __repr__(self):
     val = (self.host, self.port, self.connected)
@@ -446,7 +631,7 @@ class STR4500(object):
 
     """
     cmd = ["SC", filename]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_trigger(self, mode):
     """
@@ -468,7 +653,7 @@ class STR4500(object):
     if mode not in [0, 1, 2]:
       raise ValueError("Invalid trigger mode.")
     cmd = ["TR", mode]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def run_scenario(self):
     """
@@ -482,7 +667,7 @@ class STR4500(object):
 
     """
     cmd = ["RU"]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def status(self):
     """
@@ -494,7 +679,7 @@ class STR4500(object):
 
     """
     cmd = ["NULL"]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def end_scenario(self, stop_mode=0, save=False, timestamp="-"):
     """
@@ -524,7 +709,7 @@ class STR4500(object):
     if stop_mode not in [0, 1, 2]:
       raise ValueError("Invalid value of n.")
     cmd = [timestamp, "EN", stop_mode, int(save)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def rewind_scenario(self):
     """
@@ -539,7 +724,7 @@ class STR4500(object):
     response : CommandResponse
     """
     cmd = ["RW"]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_power(self, on, timestamp="-"):
     """
@@ -562,7 +747,7 @@ class STR4500(object):
     """
     cmd = [timestamp, "POW_ON", VEHICLE_ANTENNA, int(on), STR4500.chan,
            STR4500.is_chan, STR4500.all_chans]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_power_mode(self, mode, timestamp="-"):
     """
@@ -585,7 +770,7 @@ class STR4500(object):
     """
     cmd = [timestamp, "POW_MODE", VEHICLE_ANTENNA, mode,
            STR4500.chan, STR4500.is_chan, STR4500.all_chans]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_power_level(self, level, absolute, timestamp="-"):
     """
@@ -610,7 +795,7 @@ class STR4500(object):
     """
     cmd = [timestamp, "POW_LEV", VEHICLE_ANTENNA, level, STR4500.chan,
            STR4500.is_chan, STR4500.all_chans, int(absolute)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def set_prn(self, on=True, timestamp="-"):
     """
@@ -631,7 +816,7 @@ class STR4500(object):
 
     """
     cmd = [timestamp, "PRN_CODE", STR4500.chan, STR4500.all_chans, int(on)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def enable_hardware(self, mode=True):
     """
@@ -649,7 +834,7 @@ class STR4500(object):
 
     """
     cmd = ["HARDWARE_ON", int(mode)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def enable_popups(self, mode=True):
     """
@@ -670,7 +855,7 @@ class STR4500(object):
 
     """
     cmd = ["POPUPS_ON", int(mode)]
-    return handle(self.host, self.port, cmd)
+    return self.handler(self.host, self.port, cmd)
 
   def time(self):
     """
@@ -683,7 +868,7 @@ class STR4500(object):
 
     """
     cmd = ["TIME"]
-    return int(handle(self.host, self.port, cmd).data)
+    return int(self.handler(self.host, self.port, cmd).data)
 
   def scenario_duration(self):
     """
@@ -696,7 +881,7 @@ class STR4500(object):
 
     """
     cmd = ["SC_DURATION"]
-    return handle(self.host, self.port, cmd).data
+    return self.handler(self.host, self.port, cmd).data
 
 #TODO (Buro): fix this.
 # if __name__ == "__main__":
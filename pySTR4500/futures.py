@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Non-blocking command API.
+
+An AsyncSTR4500 has the same methods as STR4500, but each returns a
+CommandFuture immediately. Commands are issued by a background I/O
+thread per host, in the order they were called, so callers can queue
+many commands and only block on the results they check:
+
+  dev = AsyncSTR4500("192.168.1.209")
+  for chan in xrange(0, 12):
+    dev.chan.set_power_level(chan, level=-3.0, absolute=False)
+  assert dev.time().result() > 0
+
+"""
+
+import logging
+import threading
+import Queue
+
+from pySTR4500.client import *
+
+log = logging.getLogger(__name__)
+
+class CommandFuture(object):
+  """
+  Eventual result of an STR4500 command.
+  """
+
+  def __init__(self):
+    self._response = None
+    self._error = None
+    self._callbacks = []
+    self._lock = threading.Lock()
+    self._event = threading.Event()
+
+  def __repr__(self):
+    if not self.done():
+      return "<CommandFuture (pending)>"
+    val = self._error if self._error is not None else self._response
+    return "<CommandFuture (done = %r)>" % (val,)
+
+  def done(self):
+    return self._event.is_set()
+
+  def result(self, timeout=None):
+    """
+    Block until the command completes.
+
+    Parameters
+    ----------
+    timeout : float, optional
+      Seconds to wait. Defaults to None (wait indefinitely).
+
+    Returns
+    -------
+    response : CommandResponse
+      Or the value computed by then().
+
+    """
+    if not self._event.wait(timeout):
+      raise RuntimeError("Timed out waiting for STR4500 command.")
+    if self._error is not None:
+      raise self._error
+    return self._response
+
+  def exception(self, timeout=None):
+    """
+    Block until the command completes, returning its exception (or
+    None if it succeeded).
+    """
+    if not self._event.wait(timeout):
+      raise RuntimeError("Timed out waiting for STR4500 command.")
+    return self._error
+
+  def add_done_callback(self, fn):
+    """
+    Call fn(future) once the command completes (immediately if it
+    already has), on the thread that completes it. Exceptions raised by
+    fn are logged and otherwise ignored.
+    """
+    with self._lock:
+      if not self.done():
+        self._callbacks.append(fn)
+        return
+    self._invoke(fn)
+
+  def then(self, fn):
+    """
+    Get a future for fn(response), e.g. future.then(lambda r: r.data).
+    """
+    mapped = CommandFuture()
+    def chain(future):
+      if future._error is not None:
+        mapped.set_exception(future._error)
+        return
+      try:
+        mapped.set_result(fn(future._response))
+      except Exception as e:
+        mapped.set_exception(e)
+    self.add_done_callback(chain)
+    return mapped
+
+  def set_result(self, response):
+    self._complete(response, None)
+
+  def set_exception(self, error):
+    self._complete(None, error)
+
+  def _complete(self, response, error):
+    with self._lock:
+      self._response = response
+      self._error = error
+      self._event.set()
+      callbacks, self._callbacks = self._callbacks, []
+    for fn in callbacks:
+      self._invoke(fn)
+
+  def _invoke(self, fn):
+    # Callbacks run on the host's I/O thread, which must survive them.
+    try:
+      fn(self)
+    except Exception:
+      log.exception("Exception in CommandFuture callback %r", fn)
+
+class _HostWorker(object):
+  """
+  FIFO command queue and the I/O thread for one host. SimPLEX takes one
+  command per connection, so the thread opens and owns each connection
+  in turn.
+  """
+
+  def __init__(self, handler):
+    self.handler = handler
+    self.queue = Queue.Queue()
+    self.thread = threading.Thread(target=self.run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def run(self):
+    while True:
+      item = self.queue.get()
+      if item is None:
+        return
+      host, port, cmd, future = item
+      try:
+        response = self.handler(host, port, cmd)
+      except Exception as e:
+        future.set_exception(e)
+      else:
+        future.set_result(response)
+
+class CommandExecutor(object):
+  """
+  Issues commands on a background I/O thread per (host, port),
+  preserving per-host command order.
+
+  Parameters
+  ----------
+  handler : callable, optional
+    Called as handler(host, port, cmd) to issue each command.
+    Defaults to handle().
+
+  Returns
+  ----------
+  executor : CommandExecutor
+
+  """
+
+  def __init__(self, handler=None):
+    self.handler = handler or handle
+    self._workers = {}
+    self._lock = threading.Lock()
+
+  def __repr__(self):
+    return "<CommandExecutor (hosts = %s)>" % len(self._workers)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def handle(self, host, port, cmd):
+    """
+    Queue a command for its host's I/O thread.
+
+    Parameters
+    ----------
+    host : str
+      IPv4 address or hostname.
+    port : int
+      SimPLEX port.
+    cmd : [str]
+      Vector of command parameters.
+
+    Returns
+    ----------
+    future : CommandFuture
+
+    """
+    future = CommandFuture()
+    with self._lock:
+      if self._workers is None:
+        raise RuntimeError("CommandExecutor is closed.")
+      worker = self._workers.get((host, port))
+      if worker is None:
+        worker = self._workers[(host, port)] = _HostWorker(self.handler)
+      worker.queue.put((host, port, cmd, future))
+    return future
+
+  def close(self):
+    """
+    Issue all queued commands and stop the I/O threads.
+    """
+    with self._lock:
+      workers, self._workers = self._workers, None
+    for worker in (workers or {}).itervalues():
+      worker.queue.put(None)
+      worker.thread.join()
+
+class AsyncSTR4500(STR4500):
+  """
+  STR4500 controller whose methods return CommandFutures.
+
+  Parameters
+  ----------
+  host : str
+    IPv4 address or hostname. Defaults to localhost.
+  port : int
+    SimPLEX port. Defaults to 15650.
+  executor : CommandExecutor, optional
+    Executor to issue commands on, shared between controllers if
+    given. Defaults to a new CommandExecutor.
+
+  Returns
+  ----------
+  controller : AsyncSTR4500
+
+  """
+
+  def __init__(self, host="127.0.0.1", port=15650, executor=None):
+    self.host = host
+    self.port = port
+    self.executor = executor or CommandExecutor()
+    self.handler = self.executor.handle
+    # Issue a status check for network connection.
+    self.connected = self.status().result() is not None
+    self.chan = Channel(self.host, self.port, self.handler)
+    self.sat = Satellite(self.host, self.port, self.handler)
+
+  def time(self):
+    """
+    Get time into run.
+
+    Returns
+    -------
+    future : CommandFuture
+      Resolves to the time into run in integer seconds.
+
+    """
+    cmd = ["TIME"]
+    return self.handler(self.host, self.port, cmd).then(lambda r: int(r.data))
+
+  def scenario_duration(self):
+    """
+    Get duration of scenario.
+
+    Returns
+    -------
+    future : CommandFuture
+      Resolves to the duration in the form d hh:mm.
+
+    """
+    cmd = ["SC_DURATION"]
+    return self.handler(self.host, self.port, cmd).then(lambda r: r.data)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Crash-safe journal of acknowledged commands, for fast controller
+recovery.
+
+A CommandJournal sits in front of client.handle() and appends every
+acknowledged command to a per-host journal file, fsyncing in batches.
+Every snapshot_every commands the reduced device state (scenario,
+power, power mode, power level and PRN settings) is written atomically
+as a snapshot and the journal is truncated. A restarted controller
+rebuilds the device state from the snapshot plus the journal tail:
+
+  journal = CommandJournal("/var/lib/str4500")
+  state = journal.state("192.168.1.209", 15650)
+  dev = STR4500("192.168.1.209", handler=journal.handle)
+  if state.scenario == wanted and dev.status().status == "Running":
+    ...  # resume
+
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from pySTR4500.client import *
+
+class DeviceState(object):
+  """
+  Device configuration reduced from acknowledged commands.
+
+  Power, mode, level and PRN tables are keyed by channel/satellite ID
+  (as a string, for JSON), or ALL for all-channel settings. Timestamped
+  commands wait in scheduled until resolve() folds those that are due
+  into the tables; the rest are dropped when the scenario ends or is
+  reselected or rewound.
+  """
+
+  def __init__(self):
+    self.scenario = None
+    self.status = None
+    self.trigger_mode = 0
+    self.hardware = True
+    self.popups = True
+    self.power = {}
+    self.modes = {}
+    self.levels = {}
+    self.prn = {}
+    self.scheduled = []
+
+  def __eq__(self, other):
+    return self.__dict__ == other.__dict__
+
+  def __repr__(self):
+    val = (self.scenario, self.status, len(self.levels), len(self.scheduled))
+    formatted = "<DeviceState (scenario = %s, status = %s, levels = %s, " \
+                "scheduled = %s)>"
+    return formatted % val
+
+  def to_dict(self):
+    return dict(self.__dict__)
+
+  @staticmethod
+  def from_dict(d):
+    state = DeviceState()
+    state.__dict__.update(d)
+    return state
+
+  def _reset(self):
+    for table in (self.power, self.modes, self.levels, self.prn):
+      table.clear()
+    self.scheduled = []
+
+  def apply(self, cmd, status=None):
+    """
+    Update the state with an acknowledged command and its reply status.
+    """
+    if status is not None:
+      self.status = status
+    name = mnemonic(cmd)
+    cmd = map(str, cmd)
+    if name == "SC":
+      self.scenario = ",".join(cmd[1:])
+      self._reset()
+    elif name == "RW":
+      self._reset()
+    elif name == "TR":
+      self.trigger_mode = int(cmd[1])
+    elif name == "HARDWARE_ON":
+      self.hardware = bool(int(cmd[1]))
+    elif name == "POPUPS_ON":
+      self.popups = bool(int(cmd[1]))
+    elif name in TIMESTAMPED_COMMANDS and cmd[0] != "-":
+      self.scheduled.append(cmd)
+    elif name == "EN":
+      # Pending timestamped commands never fire once the scenario ends.
+      self.scheduled = []
+      if int(cmd[2]):
+        self._reset()
+    elif name == "PRN_CODE":
+      set_setting(self.prn, str(cmd[2]), int(cmd[3]), bool(int(cmd[4])))
+    elif name == "POW_ON":
+      set_setting(self.power, str(cmd[4]), int(cmd[6]), bool(int(cmd[3])))
+    elif name == "POW_MODE":
+      set_setting(self.modes, str(cmd[4]), int(cmd[6]), int(cmd[3]))
+    elif name == "POW_LEV":
+      set_setting(self.levels, str(cmd[4]), int(cmd[6]),
+                  [float(cmd[3]), bool(int(cmd[7]))])
+
+  def resolve(self, run_time):
+    """
+    Apply the scheduled commands due by a time into run, in time order,
+    and keep only those still to come.
+
+    Parameters
+    ----------
+    run_time : float
+      Time into run, seconds (e.g. from STR4500.time()).
+
+    """
+    scheduled = sorted(self.scheduled, key=lambda cmd: parse_timestamp(cmd[0]))
+    self.scheduled = []
+    for i, cmd in enumerate(scheduled):
+      if parse_timestamp(cmd[0]) > run_time:
+        self.scheduled.extend(scheduled[i:])
+        return
+      self.apply(["-"] + cmd[1:])
+
+  def commands(self):
+    """
+    Get command vectors that recreate the power and PRN configuration on
+    a device with the same scenario selected: "-" timestamped commands
+    for the current settings, then the scheduled commands still to
+    come. Call resolve() first so the settings include those that have
+    fired.
+    """
+    cmds = []
+    def target(key):
+      return (STR4500.chan, STR4500.all_chans) if key == ALL \
+        else (int(key), Channel.all_chans)
+    for key, on in sorted(self.power.iteritems()):
+      t, all_chans = target(key)
+      cmds.append(["-", "POW_ON", VEHICLE_ANTENNA, int(on), t,
+                   Channel.is_chan, all_chans])
+    for key, mode in sorted(self.modes.iteritems()):
+      t, all_chans = target(key)
+      cmds.append(["-", "POW_MODE", VEHICLE_ANTENNA, mode, t,
+                   Channel.is_chan, all_chans])
+    for key, (level, absolute) in sorted(self.levels.iteritems()):
+      t, all_chans = target(key)
+      cmds.append(["-", "POW_LEV", VEHICLE_ANTENNA, level, t,
+                   Channel.is_chan, all_chans, int(absolute)])
+    for key, on in sorted(self.prn.iteritems()):
+      t, all_chans = target(key)
+      cmds.append(["-", "PRN_CODE", t, all_chans, int(on)])
+    return cmds + [list(cmd) for cmd in self.scheduled]
+
+def _fsync_directory(directory):
+  # Make a rename in directory durable.
+  fd = os.open(directory or ".", os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+def _paths(directory, host, port):
+  name = re.sub(r"[^A-Za-z0-9.-]", "_", "%s_%s" % (host, port))
+  base = os.path.join(directory, name)
+  return base + ".journal", base + ".snapshot"
+
+def recover(directory, host, port, repair=False):
+  """
+  Rebuild a host's device state from its snapshot and journal.
+
+  Parameters
+  ----------
+  directory : str
+    Journal directory.
+  host : str
+    IPv4 address or hostname.
+  port : int
+    SimPLEX port.
+  repair : bool, optional
+    Truncate a torn tail from the journal, so records appended later
+    do not land on the same line. Defaults to False.
+
+  Returns
+  ----------
+  (state, seq) : (DeviceState, int)
+    State and sequence number of the last command applied.
+
+  """
+  journal, snapshot = _paths(directory, host, port)
+  state, seq = DeviceState(), 0
+  if os.path.exists(snapshot):
+    with open(snapshot) as f:
+      d = json.load(f)
+    state, seq = DeviceState.from_dict(d['state']), d['seq']
+  if os.path.exists(journal):
+    with open(journal, "r+b" if repair else "rb") as f:
+      good = 0
+      while True:
+        line = f.readline()
+        if not line.endswith(b"\n"):
+          break
+        try:
+          record = json.loads(line)
+        except ValueError:
+          # Torn write at the tail: everything after it is unacknowledged.
+          break
+        good += len(line)
+        if record['seq'] > seq:
+          state.apply(record['cmd'], record['status'])
+          seq = record['seq']
+      if repair and good < os.fstat(f.fileno()).st_size:
+        f.truncate(good)
+        f.flush()
+        os.fsync(f.fileno())
+  return state, seq
+
+class _HostJournal(object):
+  """
+  Open journal file and reduced state for one host.
+  """
+
+  def __init__(self, directory, host, port):
+    self.journal, self.snapshot = _paths(directory, host, port)
+    self.state, self.seq = recover(directory, host, port, repair=True)
+    self.since_snapshot = 0
+    self.pending = 0
+    self.synced = time.time()
+    self.f = open(self.journal, "a")
+
+  def append(self, cmd, status):
+    self.seq += 1
+    self.state.apply(cmd, status)
+    record = {'seq' : self.seq, 'cmd' : map(str, cmd), 'status' : status}
+    self.f.write(json.dumps(record, separators=(',', ':')) + "\n")
+    self.pending += 1
+    self.since_snapshot += 1
+
+  def sync(self):
+    if self.pending:
+      self.f.flush()
+      os.fsync(self.f.fileno())
+      self.pending = 0
+    self.synced = time.time()
+
+  def compact(self, run_time=None):
+    if run_time is not None:
+      self.state.resolve(run_time)
+    self.sync()
+    tmp = self.snapshot + ".tmp"
+    with open(tmp, "w") as f:
+      json.dump({'seq' : self.seq, 'state' : self.state.to_dict()}, f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.rename(tmp, self.snapshot)
+    # The rename must be durable before the journal is truncated.
+    _fsync_directory(os.path.dirname(self.snapshot))
+    # Records up to seq are now in the snapshot, so a crash before the
+    # truncation below only leaves records that recover() skips.
+    self.f.close()
+    self.f = open(self.journal, "w")
+    os.fsync(self.f.fileno())
+    self.since_snapshot = 0
+
+class CommandJournal(object):
+  """
+  Journal of acknowledged commands per host, in front of
+  client.handle().
+
+  Parameters
+  ----------
+  directory : str
+    Directory for journal and snapshot files, created if missing.
+  handler : callable, optional
+    Called as handler(host, port, cmd). Must be blocking. Defaults to
+    handle().
+  sync_every : int, optional
+    fsync after this many unsynced records. Defaults to 64.
+  sync_interval : float, optional
+    Maximum seconds a record stays unsynced. Defaults to 0.05.
+  snapshot_every : int, optional
+    Write a snapshot and truncate the journal after this many records.
+    Scheduled commands that have fired by then are folded into the
+    snapshot, using a TIME query through handler. Defaults to 10000.
+
+  Returns
+  ----------
+  journal : CommandJournal
+
+  """
+
+  def __init__(self, directory, handler=None, sync_every=64,
+               sync_interval=0.05, snapshot_every=10000):
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    self.directory = directory
+    self.handler = handler or handle
+    self.sync_every = sync_every
+    self.sync_interval = sync_interval
+    self.snapshot_every = snapshot_every
+    self._hosts = {}
+    self._lock = threading.Lock()
+    self._closed = threading.Event()
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __repr__(self):
+    val = (self.directory, len(self._hosts))
+    formatted = "<CommandJournal (directory = %s, hosts = %s)>"
+    return formatted % val
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def _host(self, host, port):
+    journal = self._hosts.get((host, port))
+    if journal is None:
+      journal = self._hosts[(host, port)] = \
+        _HostJournal(self.directory, host, port)
+    return journal
+
+  def state(self, host, port, resolve=True):
+    """
+    Get the recovered device state for a host.
+
+    Parameters
+    ----------
+    host : str
+      IPv4 address or hostname.
+    port : int
+      SimPLEX port.
+    resolve : bool, optional
+      Query the device's time into run through handler and fold the
+      scheduled commands that have fired into the returned state.
+      Defaults to True.
+
+    Returns
+    ----------
+    state : DeviceState
+
+    """
+    with self._lock:
+      journal = self._host(host, port)
+      state = DeviceState.from_dict(
+        json.loads(json.dumps(journal.state.to_dict())))
+    if resolve:
+      run_time = self._run_time(host, port, state)
+      if run_time is not None:
+        state.resolve(run_time)
+    return state
+
+  def _run_time(self, host, port, state):
+    """
+    Get the time into run, or None if no scheduled command can have
+    fired or the device does not answer.
+    """
+    if not state.scheduled or \
+       state.status not in ("Running", "Paused", "Ended"):
+      return None
+    try:
+      return float(self.handler(host, port, ["TIME"]).data)
+    except Exception:
+      return None
+
+  def handle(self, host, port, cmd):
+    """
+    Issue a command and journal it once acknowledged.
+
+    Returns
+    ----------
+    response : CommandResponse
+
+    """
+    response = self.handler(host, port, cmd)
+    if mnemonic(cmd) in QUERIES: # read-only, not journaled
+      return response
+    with self._lock:
+      journal = self._host(host, port)
+      journal.append(cmd, response.status)
+      compact = journal.since_snapshot >= self.snapshot_every
+      if not compact and journal.pending >= self.sync_every:
+        journal.sync()
+      state = journal.state
+    if compact:
+      # Query the time outside the lock; commands journaled meanwhile
+      # are resolved against a time that is, if anything, early.
+      run_time = self._run_time(host, port, state)
+      with self._lock:
+        if journal.since_snapshot >= self.snapshot_every:
+          journal.compact(run_time)
+    return response
+
+  def sync(self):
+    """
+    fsync all journals now.
+    """
+    with self._lock:
+      for journal in self._hosts.itervalues():
+        journal.sync()
+
+  def close(self):
+    self._closed.set()
+    self._thread.join()
+    with self._lock:
+      for journal in self._hosts.itervalues():
+        journal.sync()
+        journal.f.close()
+      self._hosts = {}
+
+  def _run(self):
+    while not self._closed.wait(self.sync_interval / 2):
+      now = time.time()
+      with self._lock:
+        for journal in self._hosts.itervalues():
+          if journal.pending and now - journal.synced >= self.sync_interval:
+            journal.sync()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Load generator for finding the sustainable command rate of a SimPLEX
+target.
+
+Each step of a ramp runs a number of concurrent workers issuing
+commands back-to-back from a weighted mix, and records the achieved
+throughput, latency percentiles and error rate. The saturation knee is
+the first step where adding concurrency stops adding throughput (or
+errors appear); the step before it is the sustainable rate.
+
+Against a live instrument:
+
+  python -m pySTR4500.loadtest 192.168.1.209 --ramp 1,2,4,8 --duration 10
+
+Against a local stand-in server that serves at most 200 commands/s:
+
+  python -m pySTR4500.loadtest --standin --service-time 0.005
+
+"""
+
+import argparse
+import random
+import SocketServer
+import sys
+import threading
+import time
+
+from pySTR4500.client import *
+
+# Command kinds, and the default mix: their relative weights.
+KINDS = ("query", "POW_LEV", "PRN_CODE")
+MIX = {"query" : 1, "POW_LEV" : 4, "PRN_CODE" : 1}
+
+def command(kind, rand=random):
+  """
+  Get a random command vector of the given kind ("query", "POW_LEV" or
+  "PRN_CODE"), formatted as Channel would send it.
+  """
+  chan = rand.randint(0, 11)
+  if kind == "query":
+    return [rand.choice(["NULL", "TIME", "SC_DURATION"])]
+  if kind == "POW_LEV":
+    return ["-", "POW_LEV", VEHICLE_ANTENNA, float(rand.randint(-20, 0)),
+            chan, Channel.is_chan, Channel.all_chans, 0]
+  if kind == "PRN_CODE":
+    return ["-", "PRN_CODE", chan, Channel.all_chans, rand.randint(0, 1)]
+  raise ValueError("Invalid command kind: %s" % kind)
+
+def check_mix(mix):
+  """
+  Check a command mix before any workers start.
+
+  Parameters
+  ----------
+  mix : dict
+    Relative weights of KINDS.
+
+  Returns
+  ----------
+  kinds : [str]
+    Kinds repeated by weight, to draw commands from.
+
+  """
+  for kind, weight in mix.iteritems():
+    if kind not in KINDS:
+      raise ValueError("Invalid command kind: %s" % kind)
+    if not isinstance(weight, (int, long)) or weight < 0:
+      raise ValueError("Invalid weight for %s: %s" % (kind, weight))
+  kinds = [k for k, w in sorted(mix.iteritems()) for _ in xrange(w)]
+  if not kinds:
+    raise ValueError("Command mix has no weight.")
+  return kinds
+
+class _StandInHandler(SocketServer.BaseRequestHandler):
+  def handle(self):
+    data = self.request.recv(BUFFER_SIZE)
+    if not data:
+      return
+    server = self.server
+    with server.lock:
+      server.commands += 1
+      if server.service_time:
+        time.sleep(server.service_time)
+    reply = "<msg><status>2</status><data>%s</data></msg>"
+    self.request.sendall(reply % server.commands)
+
+class StandInServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+  """
+  Local TCP stand-in for SimPLEX: replies "Initialised" to every
+  command, serving commands one at a time.
+
+  Parameters
+  ----------
+  host : str, optional
+    Address to listen on. Defaults to localhost.
+  port : int, optional
+    Port to listen on. Defaults to 0 (any free port).
+  service_time : float, optional
+    Seconds spent on each command, which caps throughput at
+    1 / service_time. Defaults to 0.
+
+  Returns
+  ----------
+  server : StandInServer
+
+  """
+
+  daemon_threads = True
+  allow_reuse_address = True
+  request_queue_size = 128
+
+  def __init__(self, host="127.0.0.1", port=0, service_time=0.0):
+    SocketServer.TCPServer.__init__(self, (host, port), _StandInHandler)
+    self.service_time = service_time
+    self.commands = 0
+    self.lock = threading.Lock()
+    self.thread = threading.Thread(target=self.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def close(self):
+    self.shutdown()
+    self.server_close()
+
+class StepResult(object):
+  """
+  Measurements for one ramp step.
+  """
+
+  def __init__(self, concurrency, duration, latencies, errors):
+    self.concurrency = concurrency
+    self.duration = duration
+    self.commands = len(latencies) + errors
+    self.errors = errors
+    self.latencies = sorted(latencies)
+
+  def __repr__(self):
+    val = (self.concurrency, self.throughput(), self.percentile(50),
+           self.percentile(99), self.error_rate())
+    formatted = "<StepResult (concurrency = %s, throughput = %.1f, " \
+                "p50 = %s, p99 = %s, error_rate = %.3f)>"
+    return formatted % val
+
+  def throughput(self):
+    """
+    Successful commands per second.
+    """
+    return len(self.latencies) / self.duration if self.duration else 0.0
+
+  def error_rate(self):
+    return float(self.errors) / self.commands if self.commands else 0.0
+
+  def percentile(self, q):
+    """
+    q-th percentile (0 to 100) latency of successful commands, seconds.
+    """
+    if not self.latencies:
+      return None
+    k = int(round(q / 100.0 * (len(self.latencies) - 1)))
+    return self.latencies[k]
+
+def run_step(host, port, concurrency, duration, mix=MIX, handler=None,
+             seed=None):
+  """
+  Drive a target with concurrent closed-loop workers for one step.
+
+  Parameters
+  ----------
+  host : str
+    IPv4 address or hostname.
+  port : int
+    SimPLEX port.
+  concurrency : int
+    Number of workers, each with one command in flight.
+  duration : float
+    Seconds to run.
+  mix : dict, optional
+    Relative weights of "query", "POW_LEV" and "PRN_CODE" commands.
+    Defaults to MIX. Raises ValueError for unknown kinds or no weight.
+  handler : callable, optional
+    Called as handler(host, port, cmd). Defaults to handle().
+  seed : int, optional
+    Seed for the command mix.
+
+  Returns
+  ----------
+  result : StepResult
+
+  """
+  handler = handler or handle
+  kinds = check_mix(mix)
+  latencies = []
+  errors = [0]
+  lock = threading.Lock()
+  stop = time.time() + duration
+  def work(rand):
+    mine, failed = [], 0
+    while time.time() < stop:
+      cmd = command(rand.choice(kinds), rand)
+      start = time.time()
+      try:
+        handler(host, port, cmd)
+        mine.append(time.time() - start)
+      except Exception:
+        failed += 1
+    with lock:
+      latencies.extend(mine)
+      errors[0] += failed
+  rand = random.Random(seed)
+  workers = [threading.Thread(target=work,
+                              args=(random.Random(rand.random()),))
+             for _ in xrange(concurrency)]
+  start = time.time()
+  for w in workers:
+    w.start()
+  for w in workers:
+    w.join()
+  return StepResult(concurrency, time.time() - start, latencies, errors[0])
+
+def find_knee(results, min_gain=0.1, max_error_rate=0.01):
+  """
+  Find the saturation knee of a ramp.
+
+  Parameters
+  ----------
+  results : [StepResult]
+    Steps in order of increasing concurrency.
+  min_gain : float, optional
+    Minimum relative throughput gain for a step to count as still
+    scaling. Defaults to 0.1.
+  max_error_rate : float, optional
+    Error rate above which a step counts as saturated. Defaults to 0.01.
+
+  Returns
+  ----------
+  knee : int
+    Index of the first saturated step, or None if the target never
+    saturated.
+
+  """
+  for i, r in enumerate(results):
+    if r.error_rate() > max_error_rate:
+      return i
+    if i and r.throughput() < (1 + min_gain) * results[i - 1].throughput():
+      return i
+  return None
+
+def run_ramp(host, port, ramp=(1, 2, 4, 8, 16), duration=5.0, mix=MIX,
+             handler=None, seed=None):
+  """
+  Run run_step for each concurrency level in ramp.
+
+  Returns
+  ----------
+  results : [StepResult]
+
+  """
+  return [run_step(host, port, c, duration, mix, handler, seed) for c in ramp]
+
+def format_report(results, knee):
+  """
+  Render ramp results and the knee as plain text.
+  """
+  ms = lambda s: "-" if s is None else "%.1f" % (1e3 * s)
+  lines = ["%11s %10s %8s %8s %8s %8s" % ("concurrency", "cmd/s", "p50 ms",
+                                          "p90 ms", "p99 ms", "errors")]
+  for r in results:
+    lines.append("%11d %10.1f %8s %8s %8s %7.2f%%"
+                 % (r.concurrency, r.throughput(), ms(r.percentile(50)),
+                    ms(r.percentile(90)), ms(r.percentile(99)),
+                    100 * r.error_rate()))
+  if knee is None:
+    lines.append("No saturation knee found: extend the ramp.")
+  elif knee == 0:
+    lines.append("Saturated at the first step (concurrency %d)."
+                 % results[0].concurrency)
+  else:
+    sustainable = results[knee - 1]
+    lines.append("Knee at concurrency %d; sustainable rate ~%.1f cmd/s "
+                 "(concurrency %d)." % (results[knee].concurrency,
+                                        sustainable.throughput(),
+                                        sustainable.concurrency))
+  return "\n".join(lines) + "\n"
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description="Find the sustainable command rate of a SimPLEX target.")
+  parser.add_argument("host", nargs="?", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=SIMPLEX_PORT)
+  parser.add_argument("--standin", action="store_true",
+                      help="start a local stand-in server and target it")
+  parser.add_argument("--service-time", type=float, default=0.002,
+                      help="stand-in seconds per command")
+  parser.add_argument("--ramp", default="1,2,4,8,16",
+                      help="comma-separated concurrency levels")
+  parser.add_argument("--duration", type=float, default=5.0,
+                      help="seconds per step")
+  parser.add_argument("--mix", default="query=1,POW_LEV=4,PRN_CODE=1",
+                      help="command weights")
+  parser.add_argument("--min-gain", type=float, default=0.1)
+  parser.add_argument("--max-error-rate", type=float, default=0.01)
+  args = parser.parse_args(argv)
+  try:
+    mix = dict((k, int(v)) for k, v in
+               (item.split("=") for item in args.mix.split(",")))
+    check_mix(mix)
+  except ValueError as e:
+    parser.error("--mix: %s" % e)
+  ramp = [int(c) for c in args.ramp.split(",")]
+  host, port, server = args.host, args.port, None
+  if args.standin:
+    server = StandInServer(service_time=args.service_time)
+    host, port = server.server_address
+  try:
+    results = run_ramp(host, port, ramp, args.duration, mix)
+  finally:
+    if server is not None:
+      server.close()
+  knee = find_knee(results, args.min_gain, args.max_error_rate)
+  sys.stdout.write(format_report(results, knee))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Compile per-satellite power profiles (fades, blockage, multipath) into
+timestamped POW_LEV command streams. Requires NumPy.
+
+A profile sampled at 10-100 Hz would otherwise be replayed as one
+Satellite.set_power_level command per sample and satellite. The
+compiler quantizes levels to a dB step, drops samples that change by
+less than a threshold from the last commanded level, and collapses
+simultaneous updates that leave every satellite at the same level into
+a single all-channel command.
+
+"""
+
+import numpy as np
+
+from pySTR4500.client import *
+
+class CompiledProfile(object):
+  """
+  Timestamped POW_LEV command stream compiled from a power profile.
+
+  Parameters
+  ----------
+  commands : [[str]]
+    Command vectors, in time order.
+  samples : int
+    Number of input samples (times x satellites).
+  max_error : float
+    Maximum absolute difference, dB, between the input profile and
+    the level commanded at each sample time.
+
+  Returns
+  ----------
+  profile : CompiledProfile
+
+  """
+
+  def __init__(self, commands, samples, max_error):
+    self.commands = commands
+    self.samples = samples
+    self.max_error = max_error
+
+  def __repr__(self):
+    val = (len(self.commands), self.samples, self.ratio(), self.max_error)
+    formatted = "<CompiledProfile (commands = %s, samples = %s, " \
+                "ratio = %.1f, max_error = %s)>"
+    return formatted % val
+
+  def ratio(self):
+    """
+    Compression ratio: input samples per emitted command.
+    """
+    return float(self.samples) / max(len(self.commands), 1)
+
+  def send(self, host, port):
+    """
+    Issue the compiled commands, in order.
+
+    Parameters
+    ----------
+    host : str
+      IPv4 address or hostname.
+    port : int
+      SimPLEX port.
+
+    Returns
+    -------
+    count : int
+      Number of commands sent.
+
+    """
+    for cmd in self.commands:
+      handle(host, port, cmd)
+    return len(self.commands)
+
+def compile_profile(times, levels, sats, step=0.5, threshold=None,
+                    absolute=False, start=0.0, merge=True):
+  """
+  Compile a per-satellite power profile into POW_LEV commands.
+
+  Parameters
+  ----------
+  times : array_like
+    Sample times, seconds into run, shape (n,), non-decreasing.
+  levels : array_like
+    Power levels, dB, shape (n, len(sats)).
+  sats : [int]
+    Satellite ID (1 to 32) of each column of levels.
+  step : float, optional
+    Quantization step, dB. Defaults to 0.5.
+  threshold : float, optional
+    Minimum change, dB, from the last commanded level for a sample to
+    be emitted. Defaults to step.
+  absolute : bool, optional
+    True = absolute power levels,
+    False = relative to current simulated power. Defaults to False.
+  start : float, optional
+    Offset, seconds, added to times. Defaults to 0.
+  merge : bool, optional
+    Emit one all-channel command when updates at a sample time leave
+    every satellite in sats at the same level. All-channel commands
+    also apply to channels not in sats, so disable this if other
+    satellites are being driven separately. Defaults to True.
+
+  Returns
+  ----------
+  profile : CompiledProfile
+
+  """
+  times = np.asarray(times, dtype=float)
+  levels = np.asarray(levels, dtype=float)
+  if levels.ndim == 1:
+    levels = levels[:, np.newaxis]
+  if levels.shape != (len(times), len(sats)):
+    raise ValueError("levels must have shape (len(times), len(sats)).")
+  for sat in sats:
+    if not Satellite.is_valid(sat):
+      raise ValueError("Invalid satellite value.")
+  if step <= 0:
+    raise ValueError("Quantization step must be positive.")
+  if threshold is None:
+    threshold = step
+  n, m = levels.shape
+  if n == 0:
+    return CompiledProfile([], 0, 0.0)
+  quantized = np.round(levels / step) * step
+  # Only samples where the quantized level changes can be emitted; walk
+  # those per satellite to apply the threshold against the last
+  # commanded level.
+  emitted = np.zeros((n, m), dtype=bool)
+  emitted[0, :] = True
+  changes = np.zeros((n, m), dtype=bool)
+  changes[1:] = quantized[1:] != quantized[:-1]
+  for j in xrange(m):
+    last = quantized[0, j]
+    for i in np.flatnonzero(changes[:, j]):
+      if abs(quantized[i, j] - last) >= threshold - 1e-9:
+        emitted[i, j] = True
+        last = quantized[i, j]
+  # Hold each commanded level until the next emission.
+  index = np.where(emitted, np.arange(n)[:, np.newaxis], 0)
+  index = np.maximum.accumulate(index, axis=0)
+  held = quantized[index, np.arange(m)]
+  max_error = float(np.max(np.abs(held - levels)))
+  commands = []
+  rows = np.flatnonzero(emitted.any(axis=1))
+  uniform = (held[rows] == held[rows, :1]).all(axis=1)
+  for i, same in zip(rows, uniform):
+    timestamp = format_timestamp(start + times[i])
+    updated = np.flatnonzero(emitted[i])
+    if merge and same and len(updated) > 1:
+      commands.append([timestamp, "POW_LEV", VEHICLE_ANTENNA,
+                       float(held[i, 0]), STR4500.chan, STR4500.is_chan,
+                       STR4500.all_chans, int(absolute)])
+      continue
+    for j in updated:
+      commands.append([timestamp, "POW_LEV", VEHICLE_ANTENNA,
+                       float(held[i, j]), sats[j], Satellite.is_chan,
+                       Satellite.all_chans, int(absolute)])
+  return CompiledProfile(commands, n * m, max_error)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Streaming replay of recorded receiver C/N0 logs as satellite power
+levels.
+
+Logs are CSV rows of (time, PRN, C/N0), time in seconds and C/N0 in
+dB-Hz, in time order. The pipeline is a chain of generators, so files
+of any size replay in constant memory:
+
+  read_cn0_log -> power_levels -> replay (paced on the simulator clock)
+
+A reader thread feeds the sender through a bounded queue: if the
+command path falls behind, the reader blocks instead of buffering, and
+the sender coalesces overdue updates to the latest level per satellite.
+
+  stats = replay(dev, "field_log.csv.gz", reference=45.0)
+
+"""
+
+import csv
+import gzip
+import threading
+import time
+import Queue
+
+from pySTR4500.client import *
+
+def read_cn0_log(path):
+  """
+  Stream (time, PRN, C/N0) records from a CSV log. Rows that do not
+  parse (headers, comments, truncated lines) are skipped.
+
+  Parameters
+  ----------
+  path : str
+    CSV file; names ending in ".gz" are decompressed on the fly.
+
+  Returns
+  ----------
+  records : iterator of (float, int, float)
+
+  """
+  opener = gzip.open if path.endswith(".gz") else open
+  with opener(path) as f:
+    for row in csv.reader(f):
+      try:
+        yield float(row[0]), int(row[1]), float(row[2])
+      except (IndexError, ValueError):
+        continue
+
+def power_levels(records, reference=45.0, prn_map=None, stats=None):
+  """
+  Convert C/N0 records into relative satellite power levels.
+
+  Parameters
+  ----------
+  records : iterable of (float, int, float)
+    (time, PRN, C/N0) records.
+  reference : float or dict, optional
+    C/N0, dB-Hz, that the receiver sees at the scenario's simulated
+    power, either for all PRNs or as {PRN: C/N0}. Defaults to 45.0.
+  prn_map : dict, optional
+    {PRN: satellite ID}. Defaults to the PRN itself.
+  stats : ReplayStats, optional
+    Counts records and skipped (unmapped or invalid) satellites.
+
+  Returns
+  ----------
+  levels : iterator of (float, int, float)
+    (time, satellite ID, level in dB relative to simulated power).
+    Consecutive identical levels for a satellite are dropped.
+
+  """
+  last = {}
+  for t, prn, cn0 in records:
+    if stats is not None:
+      stats.records += 1
+    sat = prn if prn_map is None else prn_map.get(prn)
+    ref = reference.get(prn) if isinstance(reference, dict) else reference
+    if not Satellite.is_valid(sat) or ref is None:
+      if stats is not None:
+        stats.skipped += 1
+      continue
+    level = round(cn0 - ref, 2)
+    if last.get(sat) != level:
+      last[sat] = level
+      yield t, sat, level
+
+class SimClock(object):
+  """
+  Simulator time into run, polled from STR4500.time() at most every
+  poll_interval seconds and extrapolated on the local clock between
+  polls.
+
+  time() replies are truncated to whole seconds, so a reply t only
+  bounds the true time to [t, t + 1). Each poll nudges the estimate
+  into that window instead of resetting it to t, and the clock never
+  runs backwards: if the estimate is ahead, it holds until the
+  simulator catches up.
+  """
+
+  def __init__(self, dev, poll_interval=1.0):
+    self.dev = dev
+    self.poll_interval = poll_interval
+    self._polled = None
+    self._base = None
+    self._last = None
+
+  def __call__(self):
+    now = time.time()
+    if self._polled is None or now - self._polled >= self.poll_interval:
+      run_time = float(self.dev.time())
+      if self._polled is None:
+        estimate = run_time
+      else:
+        estimate = self._base + (now - self._polled)
+        estimate = min(max(estimate, run_time), run_time + 1.0)
+      self._base, self._polled = estimate, now
+    t = self._base + (now - self._polled)
+    self._last = t if self._last is None else max(self._last, t)
+    return self._last
+
+class ReplayStats(object):
+  """
+  Counters for a replay.
+  """
+
+  def __init__(self):
+    self.records = 0
+    self.skipped = 0
+    self.sent = 0
+    self.coalesced = 0
+    self.max_lag = 0.0
+
+  def __repr__(self):
+    val = (self.records, self.skipped, self.sent, self.coalesced,
+           self.max_lag)
+    formatted = "<ReplayStats (records = %s, skipped = %s, sent = %s, " \
+                "coalesced = %s, max_lag = %.3f)>"
+    return formatted % val
+
+_DONE = object()
+
+def replay(dev, path, reference=45.0, prn_map=None, start=None, lead=0.0,
+           max_pending=256, coalesce=True, clock=None):
+  """
+  Replay a C/N0 log as Satellite.set_power_level commands, paced on the
+  simulator clock.
+
+  Parameters
+  ----------
+  dev : STR4500
+    Controller for a device with a Running scenario.
+  path : str
+    CSV log (see read_cn0_log).
+  reference : float or dict, optional
+    See power_levels. Defaults to 45.0.
+  prn_map : dict, optional
+    See power_levels.
+  start : float, optional
+    Time into run, seconds, at which the first log record applies.
+    Defaults to the current simulator time.
+  lead : float, optional
+    Seconds ahead of simulator time to issue commands, to cover
+    command latency. Defaults to 0.
+  max_pending : int, optional
+    Maximum records buffered between reader and sender. Defaults to
+    256.
+  coalesce : bool, optional
+    When behind schedule, send only the latest overdue level per
+    satellite. Defaults to True.
+  clock : callable, optional
+    Returns simulator time into run, seconds. Defaults to
+    SimClock(dev).
+
+  Returns
+  ----------
+  stats : ReplayStats
+
+  """
+  stats = ReplayStats()
+  clock = clock or SimClock(dev)
+  queue = Queue.Queue(max_pending)
+  stop = threading.Event()
+  errors = []
+  def read():
+    try:
+      for item in power_levels(read_cn0_log(path), reference, prn_map, stats):
+        while not stop.is_set():
+          try:
+            queue.put(item, timeout=0.1)
+            break
+          except Queue.Full:
+            continue
+        if stop.is_set():
+          return
+    except Exception as e:
+      errors.append(e)
+    finally:
+      while not stop.is_set():
+        try:
+          queue.put(_DONE, timeout=0.1)
+          return
+        except Queue.Full:
+          continue
+  reader = threading.Thread(target=read)
+  reader.daemon = True
+  reader.start()
+  try:
+    item = queue.get()
+    offset = None
+    while item is not _DONE:
+      t, sat, level = item
+      if offset is None:
+        offset = (clock() if start is None else start) - t
+      due = t + offset - lead
+      now = clock()
+      if now < due:
+        time.sleep(due - now)
+        now = due
+      pending = {sat : level}
+      item = queue.get()
+      if coalesce:
+        # Overdue updates: keep only the latest level per satellite.
+        while item is not _DONE and item[0] + offset - lead <= now:
+          stats.coalesced += item[1] in pending
+          pending[item[1]] = item[2]
+          item = queue.get()
+      stats.max_lag = max(stats.max_lag, now - due)
+      for sat, level in sorted(pending.iteritems()):
+        dev.sat.set_power_level(sat, level, absolute=False)
+        stats.sent += 1
+  finally:
+    stop.set()
+    reader.join()
+  if errors:
+    raise errors[0]
+  return stats
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Compact columnar store for command results. Requires NumPy.
+
+Sweeps that keep a CommandResponse per command grow by hundreds of
+bytes per command. A ResultStore keeps one packed 29-byte record per
+command in a NumPy structured array instead, optionally backed by a
+memory-mapped file so campaigns larger than RAM spill to disk:
+
+  results = ResultStore(path="campaign.results")
+  dev = STR4500("192.168.1.209", handler=results.handle)
+  ...
+  results.close()
+  print ResultStore.load("campaign.results").summary()
+
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from pySTR4500.client import *
+
+# Mnemonic enum: the code is the index into MNEMONICS.
+MNEMONICS = ("NULL", "SC", "TR", "RU", "EN", "RW", "POW_ON", "POW_MODE",
+             "POW_LEV", "PRN_CODE", "HARDWARE_ON", "POPUPS_ON", "TIME",
+             "SC_DURATION")
+MNEMONIC_CODES = dict((m, i) for i, m in enumerate(MNEMONICS))
+UNKNOWN_MNEMONIC = 0xff
+# Status codes are the STATUS_CODES values; ERROR marks a command that
+# raised instead of returning a response.
+ERROR = -1
+# No channel/satellite, for commands that do not target one.
+NO_TARGET = -1
+RESULT_DTYPE = np.dtype([
+  ('t', '<f8'),          # Issue time, seconds since the epoch.
+  ('timestamp', '<f8'),  # Time into run of timestamped commands, or NaN.
+  ('latency', '<f4'),    # Round-trip seconds.
+  ('level', '<f4'),      # POW_LEV level, dB, or NaN.
+  ('target', '<i2'),     # Channel/satellite ID, 0 for all, or NO_TARGET.
+  ('mnemonic', 'u1'),    # Index into MNEMONICS.
+  ('status', 'i1'),      # STATUS_VALUES key, or ERROR.
+  ('all_chans', '?')
+])
+_ANY = object()
+
+def _fields(cmd):
+  """
+  Get (mnemonic code, timestamp, level, target, all_chans) for a
+  command vector.
+  """
+  name = mnemonic(cmd)
+  code = MNEMONIC_CODES.get(name, UNKNOWN_MNEMONIC)
+  timestamp, level, target, all_chans = float('nan'), float('nan'), \
+    NO_TARGET, False
+  try:
+    if name in TIMESTAMPED_COMMANDS:
+      due = parse_timestamp(str(cmd[0]))
+      if due is not None:
+        timestamp = due
+    if name in ("POW_ON", "POW_MODE", "POW_LEV"):
+      target, all_chans = int(cmd[4]), bool(int(cmd[6]))
+      if name == "POW_LEV":
+        level = float(cmd[3])
+    elif name == "PRN_CODE":
+      target, all_chans = int(cmd[2]), bool(int(cmd[3]))
+  except (IndexError, ValueError):
+    pass
+  return code, timestamp, level, target, all_chans
+
+def _open(path):
+  # mmap cannot map an empty file.
+  if not os.path.getsize(path):
+    return np.zeros(0, RESULT_DTYPE)
+  return np.memmap(path, RESULT_DTYPE, mode="r")
+
+class ResultStore(object):
+  """
+  Append-only columnar table of command results.
+
+  Parameters
+  ----------
+  capacity : int, optional
+    Initial number of records; the store doubles as it fills.
+    Defaults to 4096.
+  path : str, optional
+    Back the store with a memory-mapped file, created (or truncated)
+    here. Defaults to None (in memory).
+  handler : callable, optional
+    Called as handler(host, port, cmd) by handle(). Must be blocking.
+    Defaults to client.handle().
+
+  Returns
+  ----------
+  results : ResultStore
+
+  """
+
+  def __init__(self, capacity=4096, path=None, handler=None):
+    self.path = path
+    self.handler = handler or handle
+    self._len = 0
+    self._closed = False
+    self._lock = threading.Lock()
+    self._data = self._allocate(max(int(capacity), 1), create=True)
+
+  def __repr__(self):
+    val = (len(self), self.capacity(), self.path)
+    formatted = "<ResultStore (records = %s, capacity = %s, path = %s)>"
+    return formatted % val
+
+  def __len__(self):
+    return self._len
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  @staticmethod
+  def load(path):
+    """
+    Open a closed file-backed store read-only.
+
+    Returns
+    ----------
+    results : ResultStore
+
+    """
+    results = ResultStore.__new__(ResultStore)
+    results.path = path
+    results.handler = None
+    results._closed = True
+    results._lock = threading.Lock()
+    results._data = _open(path)
+    results._len = len(results._data)
+    return results
+
+  def capacity(self):
+    return len(self._data)
+
+  def _allocate(self, capacity, create=False):
+    if self.path is None:
+      data = np.zeros(capacity, RESULT_DTYPE)
+      if not create:
+        data[:self._len] = self._data[:self._len]
+      return data
+    if not create:
+      self._data.flush()
+      del self._data
+    with open(self.path, "wb" if create else "r+b") as f:
+      f.truncate(capacity * RESULT_DTYPE.itemsize)
+    return np.memmap(self.path, RESULT_DTYPE, mode="r+", shape=(capacity,))
+
+  def append(self, cmd, status, latency=float('nan'), t=None):
+    """
+    Record a command result.
+
+    Parameters
+    ----------
+    cmd : [str]
+      Vector of command parameters.
+    status : str
+      Response status (a STATUS_VALUES value), or None if the command
+      failed.
+    latency : float, optional
+      Round-trip seconds.
+    t : float, optional
+      Issue time, seconds since the epoch. Defaults to now.
+
+    """
+    code, timestamp, level, target, all_chans = _fields(cmd)
+    record = (time.time() if t is None else t, timestamp, latency, level,
+              target, code, STATUS_CODES.get(status, ERROR), all_chans)
+    with self._lock:
+      if self._len == len(self._data):
+        self._data = self._allocate(2 * len(self._data))
+      self._data[self._len] = record
+      self._len += 1
+
+  def handle(self, host, port, cmd):
+    """
+    Issue a command and record its result.
+
+    Returns
+    ----------
+    response : CommandResponse
+
+    """
+    start = time.time()
+    status = None
+    try:
+      response = self.handler(host, port, cmd)
+      status = response.status
+      return response
+    finally:
+      self.append(cmd, status, time.time() - start, start)
+
+  def flush(self):
+    if isinstance(self._data, np.memmap):
+      self._data.flush()
+
+  def close(self):
+    """
+    Flush a file-backed store and trim the file to the records written,
+    for load().
+    """
+    if self.path is None or self._closed:
+      return
+    with self._lock:
+      self._data.flush()
+      del self._data
+      with open(self.path, "r+b") as f:
+        f.truncate(self._len * RESULT_DTYPE.itemsize)
+      self._data = _open(self.path)
+      self._closed = True
+
+  def array(self):
+    """
+    Get the records as a structured array view (RESULT_DTYPE).
+    """
+    return self._data[:self._len]
+
+  def select(self, mnemonic=None, target=None, status=_ANY):
+    """
+    Get the records matching a mnemonic, channel/satellite ID and/or
+    status (a STATUS_VALUES value, or None for failed commands).
+    """
+    a = self.array()
+    mask = np.ones(len(a), bool)
+    if mnemonic is not None:
+      mask &= a['mnemonic'] == MNEMONIC_CODES.get(mnemonic, UNKNOWN_MNEMONIC)
+    if target is not None:
+      mask &= a['target'] == target
+    if status is not _ANY:
+      mask &= a['status'] == STATUS_CODES.get(status, ERROR)
+    return a[mask]
+
+  def errors(self):
+    """
+    Get the records of commands that failed.
+    """
+    a = self.array()
+    return a[a['status'] == ERROR]
+
+  def counts(self):
+    """
+    Get the number of commands per mnemonic, as {mnemonic: count}.
+    """
+    codes = np.bincount(self.array()['mnemonic'], minlength=256)
+    return dict((MNEMONICS[code] if code < len(MNEMONICS) else "?",
+                 int(codes[code])) for code in np.flatnonzero(codes))
+
+  def status_counts(self):
+    """
+    Get the number of replies per status, as {status: count}; failed
+    commands are counted under None.
+    """
+    statuses, counts = np.unique(self.array()['status'], return_counts=True)
+    return dict((STATUS_VALUES.get(int(s)), int(n))
+                for s, n in zip(statuses, counts))
+
+  def latency_percentiles(self, percentiles=(50, 90, 99), mnemonic=None):
+    """
+    Get round-trip latency percentiles, seconds, as {percentile: value},
+    over all commands or those of one mnemonic.
+    """
+    a = self.select(mnemonic) if mnemonic else self.array()
+    latency = a['latency'][np.isfinite(a['latency'])]
+    if not len(latency):
+      return dict((p, float('nan')) for p in percentiles)
+    values = np.percentile(latency.astype(np.float64), percentiles)
+    return dict(zip(percentiles, map(float, values)))
+
+  def levels(self, target):
+    """
+    Get the commanded power levels for a channel/satellite ID.
+
+    Returns
+    ----------
+    (t, level) : (numpy.array, numpy.array)
+      Issue times and levels, dB, of acknowledged POW_LEV commands.
+
+    """
+    a = self.select("POW_LEV", target)
+    a = a[a['status'] != ERROR]
+    return a['t'], a['level']
+
+  def summary(self):
+    """
+    Get per-mnemonic statistics.
+
+    Returns
+    ----------
+    summary : dict
+      {mnemonic: {count, errors, mean, p99}}, latencies in seconds.
+
+    """
+    a = self.array()
+    summary = {}
+    for code in np.unique(a['mnemonic']):
+      rows = a[a['mnemonic'] == code]
+      latency = rows['latency'][np.isfinite(rows['latency'])]
+      latency = latency.astype(np.float64)
+      name = MNEMONICS[code] if code < len(MNEMONICS) else "?"
+      summary[name] = {
+        'count' : len(rows),
+        'errors' : int(np.count_nonzero(rows['status'] == ERROR)),
+        'mean' : float(latency.mean()) if len(latency) else float('nan'),
+        'p99' : float(np.percentile(latency, 99)) if len(latency)
+                else float('nan')
+      }
+    return summary
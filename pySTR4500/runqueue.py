@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Back-to-back scenario runs with the next scenario pre-armed.
+
+select_scenario can take many seconds for large scenarios. A RunQueue
+watches the device from a background thread and, as soon as it is
+idle (the previous run has Ended), rewinds it and selects the next
+queued scenario, so that by the time the caller has collected results
+from the previous run only run_scenario() remains:
+
+  runs = RunQueue(dev, [sims[2], sims[3], sims[4]])
+  while runs.pending():
+    filename = runs.start_next()
+    # ... wait for the run, then:
+    dev.end_scenario()
+    # ... collect results while the next scenario loads.
+
+"""
+
+import collections
+import threading
+import time
+
+from pySTR4500.client import *
+
+class RunQueue(object):
+  """
+  Queue of scenarios to run on one STR4500, pre-armed while idle.
+
+  Parameters
+  ----------
+  dev : STR4500
+    Controller for the device. Its handler must be blocking.
+  scenarios : [str], optional
+    Windows filepaths of the scenarios to run, in order.
+  poll_interval : float, optional
+    Seconds between status polls. Defaults to 0.5.
+  arm_timeout : float, optional
+    Seconds to wait for a selected scenario to reach "Initialised"
+    before giving up on it. Defaults to 300.
+
+  Returns
+  ----------
+  runs : RunQueue
+
+  """
+
+  def __init__(self, dev, scenarios=(), poll_interval=0.5, arm_timeout=300.0):
+    self.dev = dev
+    self.poll_interval = poll_interval
+    self.arm_timeout = arm_timeout
+    # Scenarios that failed to arm, as (filename, error) pairs.
+    self.failed = []
+    self._queue = collections.deque(scenarios)
+    self._armed = None
+    self._arming = None
+    # Set by start_next until the device is seen leaving "Initialised",
+    # so a just-started run is not mistaken for an idle device.
+    self._starting = False
+    self._closed = False
+    self._cond = threading.Condition()
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __repr__(self):
+    val = (self._armed, len(self._queue), len(self.failed))
+    formatted = "<RunQueue (armed = %s, queued = %s, failed = %s)>"
+    return formatted % val
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def put(self, filename):
+    """
+    Append a scenario to the queue.
+    """
+    with self._cond:
+      self._queue.append(filename)
+      self._cond.notify_all()
+
+  def pending(self):
+    """
+    Number of scenarios queued, arming or armed but not yet started.
+    """
+    with self._cond:
+      return len(self._queue) + (self._arming is not None) \
+        + (self._armed is not None)
+
+  def armed(self):
+    """
+    Filepath of the scenario selected and Initialised, or None.
+    """
+    return self._armed
+
+  def start_next(self, timeout=None):
+    """
+    Wait for the next scenario to be armed, then run it.
+
+    Parameters
+    ----------
+    timeout : float, optional
+      Seconds to wait for arming. Defaults to None (wait indefinitely).
+
+    Returns
+    -------
+    filename : str
+      Filepath of the scenario started.
+
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    with self._cond:
+      while self._armed is None:
+        if not self._queue and self._arming is None:
+          raise RuntimeError("No scenarios left to run.")
+        remaining = None if deadline is None else deadline - time.time()
+        if remaining is not None and remaining <= 0:
+          raise RuntimeError("Timed out waiting for scenario to arm.")
+        self._cond.wait(remaining)
+      filename, self._armed = self._armed, None
+      self._starting = True
+    try:
+      self.dev.run_scenario()
+    except Exception:
+      # Still selected and Initialised: keep it armed for a retry.
+      with self._cond:
+        self._armed = filename
+        self._starting = False
+      raise
+    finally:
+      with self._cond:
+        self._cond.notify_all()
+    return filename
+
+  def close(self):
+    """
+    Stop watching the device. A scenario being armed finishes arming.
+    """
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    self._thread.join()
+
+  def _run(self):
+    while True:
+      with self._cond:
+        while not self._closed and (self._armed is not None
+                                    or not self._queue):
+          self._cond.wait()
+        if self._closed:
+          return
+      try:
+        status = self.dev.status().status
+      except Exception:
+        status = None
+      if status in ("Arming", "Running", "Paused"):
+        self._starting = False
+      if status in ("Ended", "No scenario specified", "Invalid scenario") \
+         or (status == "Initialised" and not self._starting):
+        with self._cond:
+          self._arming = self._queue.popleft()
+        try:
+          self._arm(self._arming, status)
+        except Exception as e:
+          with self._cond:
+            self.failed.append((self._arming, e))
+            self._arming = None
+            self._cond.notify_all()
+          continue
+        with self._cond:
+          self._armed, self._arming = self._arming, None
+          self._starting = False
+          self._cond.notify_all()
+        continue
+      with self._cond:
+        self._cond.wait(self.poll_interval)
+
+  def _arm(self, filename, status):
+    if status == "Ended":
+      self.dev.rewind_scenario()
+    self.dev.select_scenario(filename)
+    deadline = time.time() + self.arm_timeout
+    while True:
+      status = self.dev.status().status
+      if status == "Initialised":
+        return
+      if status == "Invalid scenario":
+        raise RuntimeError("Invalid scenario: %s" % filename)
+      if time.time() > deadline:
+        raise RuntimeError("Timed out arming scenario: %s" % filename)
+      time.sleep(self.poll_interval)
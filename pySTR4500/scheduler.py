@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Priority-aware, rate-limited command scheduling.
+
+SimPLEX stalls if driven past some sustainable command rate, and dense
+power updates would otherwise delay scenario control commands queued
+behind them. A CommandScheduler sits in front of client.handle(): each
+host gets a token bucket and a dispatcher thread that always issues
+the most urgent pending command next.
+
+  scheduler = CommandScheduler(rate=20.0)
+  dev = STR4500("192.168.1.209", handler=scheduler.handle)
+
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from pySTR4500.client import *
+from pySTR4500.futures import CommandFuture
+
+# Priority classes, most urgent first.
+CONTROL = 0
+QUERY = 1
+BULK = 2
+PRIORITIES = {
+  "SC" : CONTROL,
+  "RU" : CONTROL,
+  "EN" : CONTROL,
+  "RW" : CONTROL,
+  "TR" : CONTROL,
+  "HARDWARE_ON" : CONTROL,
+  "POPUPS_ON" : CONTROL,
+  "NULL" : QUERY,
+  "TIME" : QUERY,
+  "SC_DURATION" : QUERY,
+  "POW_ON" : BULK,
+  "POW_MODE" : BULK,
+  "POW_LEV" : BULK,
+  "PRN_CODE" : BULK
+}
+
+def priority(cmd):
+  """
+  Get the priority class of a command vector. Unknown commands are
+  treated as bulk traffic.
+  """
+  return PRIORITIES.get(mnemonic(cmd), BULK)
+
+class TokenBucket(object):
+  """
+  Token bucket rate limiter.
+
+  Parameters
+  ----------
+  rate : float
+    Sustained rate, tokens per second.
+  burst : int, optional
+    Bucket capacity: how many tokens may be spent back-to-back after
+    an idle period. Defaults to 1.
+
+  Returns
+  ----------
+  bucket : TokenBucket
+
+  """
+
+  def __init__(self, rate, burst=1):
+    if rate <= 0 or burst < 1:
+      raise ValueError("Invalid rate limit.")
+    self.rate = float(rate)
+    self.burst = burst
+    self.tokens = float(burst)
+    self.stamp = time.time()
+
+  def __repr__(self):
+    val = (self.rate, self.burst)
+    formatted = "<TokenBucket (rate = %s, burst = %s)>"
+    return formatted % val
+
+  def delay(self):
+    """
+    Seconds until a token is available (0 if one is available now).
+    """
+    now = time.time()
+    self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+    self.stamp = now
+    return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+  def take(self):
+    """
+    Spend a token. Call only once delay() has returned 0.
+    """
+    self.tokens -= 1
+
+class _HostQueue(object):
+  """
+  Pending commands and the dispatcher thread for one host.
+  """
+
+  def __init__(self, handler, bucket):
+    self.handler = handler
+    self.bucket = bucket
+    self.heap = []
+    self.closed = False
+    self.cond = threading.Condition()
+    self.thread = threading.Thread(target=self.run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def put(self, level, seq, host, port, cmd, future):
+    with self.cond:
+      if self.closed:
+        raise RuntimeError("CommandScheduler is closed.")
+      heapq.heappush(self.heap, (level, seq, host, port, cmd, future))
+      self.cond.notify()
+
+  def close(self):
+    with self.cond:
+      self.closed = True
+      self.cond.notify()
+    self.thread.join()
+
+  def run(self):
+    while True:
+      with self.cond:
+        while not self.heap and not self.closed:
+          self.cond.wait()
+        if not self.heap:
+          return
+        delay = self.bucket.delay()
+        if delay > 0:
+          # Wait for a token before choosing a command, so anything
+          # more urgent that arrives meanwhile goes first.
+          self.cond.wait(delay)
+          continue
+        self.bucket.take()
+        _, _, host, port, cmd, future = heapq.heappop(self.heap)
+      try:
+        response = self.handler(host, port, cmd)
+      except Exception as e:
+        future.set_exception(e)
+      else:
+        future.set_result(response)
+
+class CommandScheduler(object):
+  """
+  Rate-limited priority scheduler in front of client.handle().
+
+  Commands for each (host, port) are issued one at a time, at most rate
+  per second, scenario control first, then queries, then power/PRN
+  updates; commands of equal priority keep their submission order.
+
+  Parameters
+  ----------
+  rate : float, optional
+    Maximum commands per second per host. Defaults to 20.
+  burst : int, optional
+    Commands allowed back-to-back after an idle period. Defaults to 1.
+  handler : callable, optional
+    Called as handler(host, port, cmd) to issue each command.
+    Defaults to handle().
+
+  Returns
+  ----------
+  scheduler : CommandScheduler
+
+  """
+
+  def __init__(self, rate=20.0, burst=1, handler=None):
+    self.rate = rate
+    self.burst = burst
+    self.handler = handler or handle
+    self._hosts = {}
+    self._rates = {}
+    self._lock = threading.Lock()
+    self._seq = itertools.count()
+    self._closed = False
+
+  def __repr__(self):
+    val = (self.rate, self.burst, len(self._hosts))
+    formatted = "<CommandScheduler (rate = %s, burst = %s, hosts = %s)>"
+    return formatted % val
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def set_rate(self, host, port, rate, burst=1):
+    """
+    Set the rate limit for one host, overriding rate and burst.
+    """
+    bucket = TokenBucket(rate, burst)
+    with self._lock:
+      self._rates[(host, port)] = (rate, burst)
+      queue = self._hosts.get((host, port))
+    if queue is not None:
+      with queue.cond:
+        queue.bucket = bucket
+        queue.cond.notify()
+
+  def submit(self, host, port, cmd, level=None):
+    """
+    Queue a command without waiting for it.
+
+    Parameters
+    ----------
+    host : str
+      IPv4 address or hostname.
+    port : int
+      SimPLEX port.
+    cmd : [str]
+      Vector of command parameters.
+    level : int, optional
+      Priority class (CONTROL, QUERY or BULK). Defaults to
+      priority(cmd).
+
+    Returns
+    ----------
+    future : CommandFuture
+
+    """
+    if level is None:
+      level = priority(cmd)
+    with self._lock:
+      if self._closed:
+        raise RuntimeError("CommandScheduler is closed.")
+      queue = self._hosts.get((host, port))
+      if queue is None:
+        rate, burst = self._rates.get((host, port), (self.rate, self.burst))
+        queue = _HostQueue(self.handler, TokenBucket(rate, burst))
+        self._hosts[(host, port)] = queue
+    future = CommandFuture()
+    queue.put(level, next(self._seq), host, port, cmd, future)
+    return future
+
+  def handle(self, host, port, cmd):
+    """
+    Schedule a command and block until its response, like handle().
+
+    Returns
+    ----------
+    response : CommandResponse
+
+    """
+    return self.submit(host, port, cmd).result()
+
+  def close(self):
+    """
+    Issue all pending commands and stop the dispatcher threads. Later
+    submissions raise RuntimeError.
+    """
+    with self._lock:
+      self._closed = True
+      queues, self._hosts = self._hosts.values(), {}
+    for queue in queues:
+      queue.close()
@@ -11,9 +11,27 @@
 
 """
 Utilities for loading simulation scenarios.
+
+The index of scenarios can be refreshed from a local mirror of the
+SimPLEX scenario directory (e.g. an SMB mount or rsync copy):
+
+  python -m pySTR4500.sims /mnt/simplex/Scenarios --cache .sims_cache
+
 """
 
+import argparse
+import json
+import os
+import sys
+import time
+
 SIMS_DICTIONARY = "./sim_scenarios.txt"
+WINDOWS_ROOT = "C:\\Program Files\\Spirent Communications\\SimPLEX\\Scenarios"
+SCENARIO_EXTENSION = ".sim"
+# Directories modified this recently are rescanned on the next scan too,
+# since a change within the filesystem's mtime granularity would not
+# move their mtime.
+RACY_SECONDS = 2.0
 
 def parse_sims_dictionary(path = SIMS_DICTIONARY):
   """
@@ -34,6 +52,210 @@ def parse_sims_dictionary(path = SIMS_DICTIONARY):
   index = {}
   with open(path) as f:
     for line in f:
-       (key, val) = line.split(",")
+       (key, val) = line.split(",", 1)
        index[int(key)] = val.rstrip() # rstrip not working?
   return index
+
+def write_sims_dictionary(index, path = SIMS_DICTIONARY):
+  """
+  Atomically replace an index of simulations: readers see either the
+  old or the new file, never a partial one.
+
+  Parameters
+  ----------
+  index : dict
+    Mapping of index to Windows guest filepath.
+  path : str, optional
+    filepath to index of scenarios. Defaults to SIMS_DICTIONARY.
+
+  """
+  tmp = "%s.%d.tmp" % (path, os.getpid())
+  with open(tmp, "w") as f:
+    for key in sorted(index):
+      f.write("%d,%s\n" % (key, index[key]))
+    f.flush()
+    os.fsync(f.fileno())
+  os.rename(tmp, path)
+
+def update_sims_dictionary(filepaths, path = SIMS_DICTIONARY):
+  """
+  Update an index of simulations to a new set of filepaths. Filepaths
+  already indexed keep their keys, removed ones are dropped, and new
+  ones get keys after the highest existing key, in sorted order.
+  Indexed files without SCENARIO_EXTENSION (hand-maintained entries a
+  scan cannot find) are kept.
+
+  Parameters
+  ----------
+  filepaths : [str]
+    Windows guest filepaths.
+  path : str, optional
+    filepath to index of scenarios. Defaults to SIMS_DICTIONARY.
+
+  Returns
+  ----------
+  response : dict
+    Mapping of index to Windows guest filepath.
+
+  """
+  old = parse_sims_dictionary(path) if os.path.exists(path) else {}
+  wanted = set(filepaths)
+  index = dict((key, val) for key, val in old.iteritems()
+               if val in wanted
+               or not val.lower().endswith(SCENARIO_EXTENSION))
+  key = max(old) if old else 0
+  for val in sorted(wanted - set(index.itervalues())):
+    key += 1
+    index[key] = val
+  if index != old:
+    write_sims_dictionary(index, path)
+  return index
+
+def windows_path(relpath, windows_root = WINDOWS_ROOT):
+  """
+  Map a path relative to the scenario mirror to the Windows guest
+  filepath that select_scenario expects.
+  """
+  parts = [p for p in relpath.replace(os.sep, "/").split("/") if p]
+  return "\\".join([windows_root.rstrip("\\")] + parts)
+
+class ScenarioScanner(object):
+  """
+  Incremental scanner of a local mirror of the SimPLEX scenario tree.
+
+  The first scan lists every directory. Later scans stat each directory
+  and only list those whose mtime changed, reusing the cached entries
+  of the rest, so a refresh costs one stat per directory instead of a
+  stat per file.
+
+  Parameters
+  ----------
+  local_root : str
+    Local mirror of windows_root.
+  windows_root : str, optional
+    Scenario directory on the Windows guest. Defaults to WINDOWS_ROOT.
+  cache : str, optional
+    JSON file to persist directory state in between processes.
+    Defaults to None (in memory only).
+
+  Returns
+  ----------
+  scanner : ScenarioScanner
+
+  """
+
+  def __init__(self, local_root, windows_root = WINDOWS_ROOT, cache = None):
+    self.local_root = local_root
+    self.windows_root = windows_root
+    self.cache = cache
+    self.listed = 0
+    self._dirs = {}
+    if cache is not None and os.path.exists(cache):
+      try:
+        with open(cache) as f:
+          d = json.load(f)
+        if d.get('local_root') == local_root:
+          self._dirs = d['dirs']
+      except (IOError, ValueError, KeyError):
+        self._dirs = {}
+
+  def __repr__(self):
+    val = (self.local_root, len(self._dirs))
+    formatted = "<ScenarioScanner (local_root = %s, dirs = %s)>"
+    return formatted % val
+
+  def scan(self):
+    """
+    Scan the mirror for scenarios.
+
+    Returns
+    ----------
+    response : [str]
+      Sorted Windows guest filepaths of scenarios.
+
+    """
+    self.listed = 0
+    now = time.time()
+    dirs = {}
+    scenarios = []
+    pending = [""]
+    while pending:
+      rel = pending.pop()
+      try:
+        mtime = os.stat(os.path.join(self.local_root, rel)).st_mtime
+      except OSError:
+        continue
+      entry = self._dirs.get(rel)
+      if entry is None or entry[0] != mtime or now - mtime < RACY_SECONDS:
+        entry = self._list(rel, mtime)
+      dirs[rel] = entry
+      _, subdirs, sims = entry
+      pending.extend(os.path.join(rel, d) for d in subdirs)
+      scenarios.extend(windows_path(os.path.join(rel, s), self.windows_root)
+                       for s in sims)
+    self._dirs = dirs
+    if self.cache is not None:
+      self._save()
+    return sorted(scenarios)
+
+  def _list(self, rel, mtime):
+    self.listed += 1
+    subdirs, sims = [], []
+    path = os.path.join(self.local_root, rel)
+    for name in sorted(os.listdir(path)):
+      if os.path.isdir(os.path.join(path, name)):
+        subdirs.append(name)
+      elif name.lower().endswith(SCENARIO_EXTENSION):
+        sims.append(name)
+    return [mtime, subdirs, sims]
+
+  def _save(self):
+    tmp = "%s.%d.tmp" % (self.cache, os.getpid())
+    with open(tmp, "w") as f:
+      json.dump({'local_root' : self.local_root, 'dirs' : self._dirs}, f)
+    os.rename(tmp, self.cache)
+
+def refresh_sims_dictionary(local_root, path = SIMS_DICTIONARY,
+                            windows_root = WINDOWS_ROOT, scanner = None):
+  """
+  Rescan a local scenario mirror and update the index of simulations.
+
+  Parameters
+  ----------
+  local_root : str
+    Local mirror of windows_root.
+  path : str, optional
+    filepath to index of scenarios. Defaults to SIMS_DICTIONARY.
+  windows_root : str, optional
+    Scenario directory on the Windows guest. Defaults to WINDOWS_ROOT.
+  scanner : ScenarioScanner, optional
+    Scanner to reuse between refreshes. Defaults to a new one.
+
+  Returns
+  ----------
+  response : dict
+    Mapping of index to Windows guest filepath.
+
+  """
+  scanner = scanner or ScenarioScanner(local_root, windows_root)
+  return update_sims_dictionary(scanner.scan(), path)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description="Refresh the index of SimPLEX scenarios from a local mirror.")
+  parser.add_argument("local_root", help="local mirror of the scenario tree")
+  parser.add_argument("--index", default=SIMS_DICTIONARY,
+                      help="index of scenarios to update")
+  parser.add_argument("--windows-root", default=WINDOWS_ROOT,
+                      help="scenario directory on the Windows guest")
+  parser.add_argument("--cache", help="file to keep directory state in")
+  args = parser.parse_args(argv)
+  start = time.time()
+  scanner = ScenarioScanner(args.local_root, args.windows_root, args.cache)
+  index = update_sims_dictionary(scanner.scan(), args.index)
+  sys.stdout.write("%d scenarios, %d directories listed, %.1f ms\n"
+                   % (len(index), scanner.listed,
+                      1000 * (time.time() - start)))
+
+if __name__ == "__main__":
+  main()
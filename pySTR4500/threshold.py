@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Bisection search for receiver tracking thresholds over power levels.
+
+Instead of stepping a channel down 1 dB at a time, find_thresholds()
+bisects between a failing and a passing level, reaching a resolution r
+over a span s in about log2(s / r) probes. A user-supplied probe
+decides whether the receiver passes (e.g. tracks the satellite) at a
+level:
+
+  def tracking(sat, level):
+    return receiver.cn0(sat) is not None
+
+  results = find_thresholds(dev.sat, range(1, 9), tracking, low=-30,
+                            high=0, resolution=0.25)
+  results[5].threshold  # Lowest passing level, dB.
+
+If the bracket does not hold (high fails or low passes), it widens in
+doubling steps. Receivers hold lock at lower power than they acquire
+at, so after a failed probe each target is first driven hysteresis dB
+above its next level to regain lock, and every probe measures tracking
+from a locked state. Independent targets are searched in lock step:
+each round sets every active target, settles once, and runs all the
+probes in parallel.
+
+"""
+
+import threading
+import time
+
+from pySTR4500.client import *
+
+class ThresholdResult(object):
+  """
+  Outcome of a threshold search for one channel/satellite.
+
+  Parameters
+  ----------
+  target : int
+    Channel or satellite ID (0 for all channels).
+  threshold : float
+    Lowest passing level, dB, or None if no level up to max_level
+    passed.
+  failing : float
+    Highest failing level below threshold, dB, or None if every level
+    down to min_level passed.
+  history : [(float, bool)]
+    Probed levels and outcomes, in order.
+
+  Returns
+  ----------
+  result : ThresholdResult
+
+  """
+
+  def __init__(self, target, threshold, failing, history):
+    self.target = target
+    self.threshold = threshold
+    self.failing = failing
+    self.history = history
+
+  def __repr__(self):
+    val = (self.target, self.threshold, self.failing, self.steps())
+    formatted = "<ThresholdResult (target = %s, threshold = %s, " \
+                "failing = %s, steps = %s)>"
+    return formatted % val
+
+  def steps(self):
+    """
+    Number of probes.
+    """
+    return len(self.history)
+
+class _Search(object):
+  """
+  Bracket-and-bisect state for one target.
+  """
+
+  def __init__(self, low, high, resolution, min_level, max_level):
+    self.resolution = resolution
+    self.min_level = min_level
+    self.max_level = max_level
+    self.span = float(high - low)
+    self.up = high
+    self.down = low
+    self.passing = None
+    self.failing = None
+    self.done = False
+    self.history = []
+
+  def level(self):
+    if self.passing is None:
+      return self.up
+    if self.failing is None:
+      return self.down
+    return (self.passing + self.failing) / 2.0
+
+  def update(self, level, passed):
+    self.history.append((level, passed))
+    if passed:
+      self.passing = level
+    else:
+      self.failing = level
+    if self.passing is None:
+      self.up = min(level + self.span, self.max_level)
+      self.span *= 2
+      self.done = level >= self.max_level
+    elif self.failing is None:
+      self.down = max(level - self.span, self.min_level)
+      self.span *= 2
+      self.done = level <= self.min_level
+    else:
+      self.done = self.passing - self.failing <= self.resolution
+
+def _setter(controller, absolute):
+  if isinstance(controller, STR4500):
+    return lambda target, level: \
+      controller.set_power_level(level, absolute)
+  return lambda target, level: \
+    controller.set_power_level(target, level, absolute)
+
+def find_thresholds(controller, targets, probe, low, high, resolution=0.5,
+                    absolute=False, settle=1.0, hysteresis=3.0,
+                    min_level=None, max_level=None):
+  """
+  Search the passing threshold of several channels/satellites in
+  parallel.
+
+  Parameters
+  ----------
+  controller : Channel, Satellite or STR4500
+    Controller whose set_power_level drives the targets, e.g. dev.sat.
+    With an STR4500, targets must be [0] (all channels).
+  targets : [int]
+    Channel or satellite IDs. Searches must be independent: setting
+    one target's level must not change another's outcome.
+  probe : callable
+    Called as probe(target, level) once the level has settled; returns
+    True if the receiver passes. Probes for different targets run
+    concurrently.
+  low : float
+    Level, dB, expected to fail.
+  high : float
+    Level, dB, expected to pass. Passing must be monotonic in level.
+  resolution : float, optional
+    Stop when the failing and passing levels are this close, dB.
+    Defaults to 0.5.
+  absolute : bool, optional
+    Levels are absolute rather than relative to simulated power.
+    Defaults to False.
+  settle : float, optional
+    Seconds to wait after setting levels before probing. Defaults to
+    1.0.
+  hysteresis : float, optional
+    After a failed probe, first set the target this many dB above its
+    next level and wait settle seconds to regain lock. Should exceed
+    the receiver's acquisition/tracking gap. None probes each level in
+    whatever state the previous probe left, so the result can land
+    anywhere in that gap. Defaults to 3.0.
+  min_level : float, optional
+    Lowest level to widen the bracket to. Defaults to low - 4 * (high -
+    low).
+  max_level : float, optional
+    Highest level to widen the bracket to. Defaults to high + 4 * (high
+    - low).
+
+  Returns
+  ----------
+  results : dict
+    {target: ThresholdResult}
+
+  """
+  if not high > low:
+    raise ValueError("high must be above low.")
+  span = high - low
+  min_level = low - 4 * span if min_level is None else min_level
+  max_level = high + 4 * span if max_level is None else max_level
+  set_level = _setter(controller, absolute)
+  searches = dict((target, _Search(low, high, resolution, min_level,
+                                   max_level)) for target in targets)
+  relock = set()
+  while True:
+    active = sorted(t for t, s in searches.iteritems() if not s.done)
+    if not active:
+      break
+    levels = dict((t, searches[t].level()) for t in active)
+    relocking = [t for t in active if t in relock]
+    if hysteresis is not None and relocking:
+      for target in relocking:
+        set_level(target, levels[target] + hysteresis)
+      time.sleep(settle)
+    for target in active:
+      set_level(target, levels[target])
+    time.sleep(settle)
+    outcomes = _probe_all(probe, levels)
+    relock.clear()
+    for target in active:
+      searches[target].update(levels[target], outcomes[target])
+      if not outcomes[target]:
+        relock.add(target)
+  return dict((t, ThresholdResult(t, s.passing, s.failing, s.history))
+              for t, s in searches.iteritems())
+
+def find_threshold(controller, target, probe, low, high, **kwargs):
+  """
+  Search the passing threshold of a single channel/satellite. See
+  find_thresholds.
+
+  Returns
+  ----------
+  result : ThresholdResult
+
+  """
+  return find_thresholds(controller, [target], probe, low, high,
+                         **kwargs)[target]
+
+def _probe_all(probe, levels):
+  """
+  Run probe(target, level) for every target concurrently.
+  """
+  if len(levels) == 1:
+    target, level = levels.items()[0]
+    return {target : bool(probe(target, level))}
+  outcomes = {}
+  errors = []
+  def run(target, level):
+    try:
+      outcomes[target] = bool(probe(target, level))
+    except Exception as e:
+      errors.append(e)
+  threads = [threading.Thread(target=run, args=item)
+             for item in levels.iteritems()]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  for thread in threads:
+    thread.join()
+  if errors:
+    raise errors[0]
+  return outcomes
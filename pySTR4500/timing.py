@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Structured JSON-lines command timing log and an offline analyzer.
+
+Logging is opt-in:
+
+  from pySTR4500.client import set_command_log
+  from pySTR4500.timing import CommandLog
+  set_command_log(CommandLog("logs/str4500-%Y%m%d.jsonl"))
+
+Every command issued through client.handle() then produces one JSON
+line with the host, mnemonic, arguments, status, error and the
+connect/send/recv/parse durations. Records are queued and serialized
+by a background thread, so the command path only pays for a queue put.
+
+The analyzer streams any number of (optionally gzipped) log files:
+
+  python -m pySTR4500.timing logs/*.jsonl
+
+"""
+
+import argparse
+import gzip
+import heapq
+import json
+import math
+import os
+import sys
+import threading
+import time
+import Queue
+
+class CommandLog(object):
+  """
+  Buffered JSON-lines writer for client.handle() command records.
+
+  Parameters
+  ----------
+  path : str
+    Log file path. May contain time.strftime directives (e.g.
+    "str4500-%Y%m%d.jsonl"), evaluated against each record's start
+    time in UTC, so long campaigns roll over to new files.
+  flush_interval : float, optional
+    Maximum seconds a record waits in memory before being written.
+    Defaults to 1.0.
+  max_pending : int, optional
+    Maximum number of queued records. If the writer falls behind,
+    further records are dropped (and counted in dropped) rather than
+    blocking the caller. Defaults to 100000.
+
+  Records that cannot be written (unwritable path, full disk) are
+  counted in errors, with the latest exception in last_error; the
+  writer keeps going and reopens the file for the next record.
+
+  Returns
+  ----------
+  log : CommandLog
+
+  """
+
+  def __init__(self, path, flush_interval=1.0, max_pending=100000):
+    self.path = path
+    self.flush_interval = flush_interval
+    self.dropped = 0
+    self.errors = 0
+    self.last_error = None
+    self._queue = Queue.Queue(max_pending)
+    self._closed = False
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __repr__(self):
+    val = (self.path, self.dropped, self.errors)
+    formatted = "<CommandLog (path = %s, dropped = %s, errors = %s)>"
+    return formatted % val
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def record(self, **fields):
+    """
+    Queue a record for writing. Never blocks.
+
+    Parameters
+    ----------
+    fields : dict
+      JSON-serializable record fields. "t" (epoch seconds) selects
+      the output file when path has strftime directives.
+
+    """
+    if self._closed:
+      return
+    try:
+      self._queue.put_nowait(fields)
+    except Queue.Full:
+      self.dropped += 1
+
+  def close(self):
+    """
+    Write all pending records and stop the writer thread.
+    """
+    if not self._closed:
+      self._closed = True
+      # Never block on a full queue if the writer is gone.
+      while self._thread.is_alive():
+        try:
+          self._queue.put(None, timeout=0.1)
+          break
+        except Queue.Full:
+          continue
+      self._thread.join()
+
+  def _run(self):
+    f, current = None, None
+    try:
+      while True:
+        batch = []
+        try:
+          item = self._queue.get(timeout=self.flush_interval)
+          while item is not None:
+            batch.append(item)
+            item = self._queue.get_nowait()
+        except Queue.Empty:
+          item = True
+        for fields in batch:
+          try:
+            path = time.strftime(self.path, time.gmtime(fields.get('t')))
+            if path != current:
+              f = self._discard(f)
+              directory = os.path.dirname(path)
+              if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+              f, current = open(path, 'a'), path
+            f.write(json.dumps(fields, separators=(',', ':')) + '\n')
+          except (EnvironmentError, TypeError, ValueError) as e:
+            self._error(e)
+            f, current = self._discard(f), None
+        if f is not None:
+          try:
+            f.flush()
+          except EnvironmentError as e:
+            self._error(e)
+            f, current = self._discard(f), None
+        if item is None:
+          return
+    finally:
+      self._discard(f)
+
+  def _error(self, e):
+    self.errors += 1
+    self.last_error = e
+
+  def _discard(self, f):
+    if f is not None:
+      try:
+        f.close()
+      except EnvironmentError as e:
+        self._error(e)
+    return None
+
+class LatencyHistogram(object):
+  """
+  Log-bucketed latency histogram, for percentiles over arbitrarily
+  long streams in constant memory. Percentiles are accurate to about
+  6% of the reported value.
+  """
+
+  buckets_per_decade = 20
+
+  def __init__(self):
+    self.buckets = {}
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+
+  def __repr__(self):
+    val = (self.count, self.percentile(50), self.percentile(99))
+    formatted = "<LatencyHistogram (count = %s, p50 = %s, p99 = %s)>"
+    return formatted % val
+
+  def add(self, seconds):
+    """
+    Add a latency sample, in seconds.
+    """
+    k = int(math.floor(math.log10(max(seconds, 1e-7))
+                       * LatencyHistogram.buckets_per_decade))
+    self.buckets[k] = self.buckets.get(k, 0) + 1
+    self.count += 1
+    self.total += seconds
+    self.min = seconds if self.min is None else min(self.min, seconds)
+    self.max = seconds if self.max is None else max(self.max, seconds)
+
+  def mean(self):
+    return self.total / self.count if self.count else None
+
+  def percentile(self, q):
+    """
+    Approximate q-th percentile (0 to 100), in seconds.
+    """
+    if not self.count:
+      return None
+    rank = q / 100.0 * self.count
+    seen = 0
+    for k in sorted(self.buckets):
+      seen += self.buckets[k]
+      if seen >= rank:
+        value = 10 ** ((k + 0.5) / LatencyHistogram.buckets_per_decade)
+        return min(max(value, self.min), self.max)
+    return self.max
+
+def iter_records(paths):
+  """
+  Stream records from JSON-lines command logs, in file order.
+
+  Malformed lines (e.g. a line truncated by a crash) are skipped.
+
+  Parameters
+  ----------
+  paths : [str]
+    Log files; names ending in ".gz" are decompressed on the fly.
+
+  Returns
+  ----------
+  records : iterator of dict
+
+  """
+  for path in paths:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path) as f:
+      for line in f:
+        try:
+          yield json.loads(line)
+        except ValueError:
+          continue
+
+def analyze(records, bucket=3600, top=10):
+  """
+  Summarize a stream of command records.
+
+  Parameters
+  ----------
+  records : iterable of dict
+    Records as written by CommandLog.
+  bucket : int, optional
+    Throughput bucket width, seconds. Defaults to 3600.
+  top : int, optional
+    Number of slowest commands to keep. Defaults to 10.
+
+  Returns
+  ----------
+  summary : dict
+    count: number of records;
+    throughput: sorted [(bucket start, commands, errors)];
+    slowest: [record], slowest first;
+    mnemonics: {mnemonic: [commands, errors, LatencyHistogram]};
+    hosts: {host: LatencyHistogram}.
+
+  """
+  count = 0
+  throughput = {}
+  slowest = []
+  mnemonics = {}
+  hosts = {}
+  for n, r in enumerate(records):
+    count += 1
+    total = r.get('total') or 0.0
+    failed = int(r.get('error') is not None)
+    t = int(r.get('t') or 0) // bucket * bucket
+    tp = throughput.setdefault(t, [0, 0])
+    tp[0] += 1
+    tp[1] += failed
+    m = mnemonics.setdefault(r.get('mnemonic'), [0, 0, LatencyHistogram()])
+    m[0] += 1
+    m[1] += failed
+    m[2].add(total)
+    host = "%s:%s" % (r.get('host'), r.get('port'))
+    hosts.setdefault(host, LatencyHistogram()).add(total)
+    entry = (total, n, r)
+    if len(slowest) < top:
+      heapq.heappush(slowest, entry)
+    elif entry > slowest[0]:
+      heapq.heapreplace(slowest, entry)
+  return {'count': count,
+          'throughput': sorted((k, v[0], v[1])
+                               for k, v in throughput.iteritems()),
+          'slowest': [r for _, _, r in sorted(slowest, reverse=True)],
+          'mnemonics': mnemonics,
+          'hosts': hosts}
+
+def _ms(seconds):
+  return "-" if seconds is None else "%.1f" % (1e3 * seconds)
+
+def format_report(summary, bucket=3600):
+  """
+  Render an analyze() summary as plain text.
+  """
+  lines = ["Commands: %d" % summary['count'], "",
+           "Throughput (commands/s, per %ds bucket):" % bucket]
+  for t, n, errors in summary['throughput']:
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t))
+    lines.append("  %s  %10.3f  (%d commands, %d errors)"
+                 % (stamp, float(n) / bucket, n, errors))
+  lines += ["", "Error rates:"]
+  for m, (n, errors, _) in sorted(summary['mnemonics'].iteritems()):
+    lines.append("  %-12s %8d commands  %6.2f%% errors"
+                 % (m, n, 100.0 * errors / n))
+  lines += ["", "Latency by host (ms):",
+            "  %-24s %8s %8s %8s %8s %8s" % ("host", "count", "p50", "p90",
+                                             "p99", "max")]
+  for host, h in sorted(summary['hosts'].iteritems()):
+    lines.append("  %-24s %8d %8s %8s %8s %8s"
+                 % (host, h.count, _ms(h.percentile(50)),
+                    _ms(h.percentile(90)), _ms(h.percentile(99)),
+                    _ms(h.max)))
+  lines += ["", "Slowest commands (ms):"]
+  for r in summary['slowest']:
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(r.get('t') or 0))
+    lines.append("  %s  %8s  %s:%s  %s%s"
+                 % (stamp, _ms(r.get('total')), r.get('host'), r.get('port'),
+                    ','.join(r.get('args') or []),
+                    "  (%s)" % r['error'] if r.get('error') else ""))
+  return "\n".join(lines) + "\n"
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description="Analyze pySTR4500 JSON-lines command logs.")
+  parser.add_argument("paths", nargs="+", help="log files (.jsonl[.gz])")
+  parser.add_argument("--bucket", type=int, default=3600,
+                      help="throughput bucket width, seconds")
+  parser.add_argument("--top", type=int, default=10,
+                      help="number of slowest commands to list")
+  args = parser.parse_args(argv)
+  summary = analyze(iter_records(args.paths), args.bucket, args.top)
+  sys.stdout.write(format_report(summary, args.bucket))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+In-process virtual SimPLEX device with a controllable clock.
+
+A VirtualDevice answers the Telnet command dictionary without sockets
+or hardware, so orchestration code can be tested against hour-long
+scenarios in seconds. Its clock only moves while a scenario is Running:
+either manually with advance(), or at rate times wall-clock speed.
+
+  device = VirtualDevice({"C:\\scenarios\\ship.sim" : 4 * 3600})
+  dev = device.attach("virtual")
+  dev.select_scenario("C:\\scenarios\\ship.sim")
+  dev.run_scenario()
+  device.advance(3 * 3600)
+  assert dev.time() == 3 * 3600
+
+The device keeps the commanded power, power mode, power level and PRN
+state per channel/satellite ID; the wire format does not distinguish
+channel from satellite IDs, so neither does the device. Timestamped
+commands are applied when the run clock reaches their timestamp, and
+the scenario Ends by itself when the clock reaches its duration.
+
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from xml.sax.saxutils import escape
+
+from pySTR4500.client import *
+
+class _CommandError(Exception):
+  pass
+
+class VirtualDevice(object):
+  """
+  In-process stand-in for SimPLEX and the STR4500.
+
+  Parameters
+  ----------
+  scenarios : dict, optional
+    {Windows filepath: duration in seconds}. Selecting any other
+    filepath gives "Invalid scenario". Defaults to None (any filepath
+    is valid, with default_duration).
+  default_duration : float, optional
+    Duration, seconds, of scenarios not in scenarios. Defaults to 3600.
+  rate : float, optional
+    Run-clock seconds per wall-clock second while Running. Defaults to
+    0 (the clock only moves with advance()).
+
+  Returns
+  ----------
+  device : VirtualDevice
+
+  """
+
+  def __init__(self, scenarios=None, default_duration=3600.0, rate=0.0):
+    self.scenarios = scenarios
+    self.default_duration = default_duration
+    self.rate = rate
+    self.state = "No scenario specified"
+    self.scenario = None
+    self.duration = None
+    self.trigger_mode = 0
+    self.hardware = True
+    self.popups = True
+    self.run_time = 0.0
+    self.power = {}
+    self.modes = {}
+    self.levels = {}
+    self.prn = {}
+    self._events = []
+    self._seq = itertools.count()
+    self._wall = None
+    self._lock = threading.RLock()
+
+  def __repr__(self):
+    val = (self.state, self.scenario, self.run_time)
+    formatted = "<VirtualDevice (state = %s, scenario = %s, run_time = %s)>"
+    return formatted % val
+
+  def attach(self, host="virtual", port=SIMPLEX_PORT):
+    """
+    Route commands for (host, port) to this device.
+
+    Returns
+    -------
+    controller : STR4500
+
+    """
+    register_transport(host, port, self.dispatch)
+    return STR4500(host, port)
+
+  def detach(self, host="virtual", port=SIMPLEX_PORT):
+    register_transport(host, port, None)
+
+  def now(self):
+    """
+    Get time into run, seconds.
+    """
+    with self._lock:
+      self._sync()
+      return self.run_time
+
+  def advance(self, seconds):
+    """
+    Move the run clock forward, applying timestamped commands and
+    ending the scenario as their times are reached. Has no effect
+    unless a scenario is Running.
+
+    Returns
+    -------
+    run_time : float
+      Time into run, seconds.
+
+    """
+    with self._lock:
+      self._sync()
+      self._advance(seconds)
+      return self.run_time
+
+  def trigger(self):
+    """
+    Deliver the external trigger pulse that starts an Arming scenario
+    in trigger modes 1 and 2.
+    """
+    with self._lock:
+      if self.state == "Arming":
+        self._start()
+
+  def level(self, target):
+    """
+    Get the commanded (level, absolute) for a channel/satellite ID, or
+    None.
+    """
+    return self.levels.get(target, self.levels.get(ALL))
+
+  def dispatch(self, host, port, msg, timings=None):
+    """
+    Execute a command string, like client.dispatch().
+
+    Returns
+    ----------
+    response : str
+      XML response string.
+
+    """
+    cmd = msg.split(",")
+    with self._lock:
+      self._sync()
+      try:
+        data = self._execute(cmd)
+      except _CommandError as e:
+        return "<msg><status>%d</status><error>%s</error></msg>" \
+          % (self._code(), escape(str(e)))
+      if data is None:
+        return "<msg><status>%d</status></msg>" % self._code()
+      return "<msg><status>%d</status><data>%s</data></msg>" \
+        % (self._code(), escape(data))
+
+  def _code(self):
+    return STATUS_CODES[self.state]
+
+  def _sync(self):
+    if self.state == "Running" and self.rate:
+      now = time.time()
+      elapsed, self._wall = (now - self._wall) * self.rate, now
+      self._advance(elapsed)
+
+  def _advance(self, seconds):
+    if self.state != "Running":
+      return
+    target = min(self.run_time + seconds, self.duration)
+    while self._events and self._events[0][0] <= target:
+      due, _, cmd = heapq.heappop(self._events)
+      self.run_time = max(self.run_time, due)
+      try:
+        self._apply(cmd)
+      except _CommandError:
+        pass
+      if self.state != "Running":
+        return
+    self.run_time = target
+    if self.run_time >= self.duration:
+      self._end(0)
+
+  def _start(self):
+    self.state = "Running"
+    self._wall = time.time()
+
+  def _end(self, stop_mode):
+    self._events = []
+    if stop_mode:
+      self._reset()
+    else:
+      self.state = "Ended"
+
+  def _reset(self):
+    self.state = "Initialised"
+    self.run_time = 0.0
+    self._events = []
+    for table in (self.power, self.modes, self.levels, self.prn):
+      table.clear()
+
+  def _execute(self, cmd):
+    name = mnemonic(cmd)
+    if name in TIMESTAMPED_COMMANDS:
+      try:
+        due = parse_timestamp(cmd[0])
+      except ValueError as e:
+        raise _CommandError(e)
+      if due is not None and (self.state != "Running" or due > self.run_time):
+        if self.state not in ("Initialised", "Arming", "Running"):
+          raise _CommandError("No scenario to schedule %s in." % name)
+        heapq.heappush(self._events, (due, next(self._seq), cmd))
+        return None
+      return self._apply(cmd)
+    if name == "NULL":
+      return None
+    if name == "TIME":
+      return str(int(self.run_time))
+    if name == "SC_DURATION":
+      if self.duration is None:
+        raise _CommandError("No scenario specified.")
+      minutes = int(self.duration) // 60
+      return "%d %02d:%02d" % (minutes // 1440, minutes // 60 % 24,
+                               minutes % 60)
+    if name == "SC":
+      if self.state not in ("No scenario specified", "Invalid scenario",
+                            "Initialised"):
+        raise _CommandError("Cannot select scenario in state %s."
+                            % self.state)
+      filename = ",".join(cmd[1:])
+      if self.scenarios is not None and filename not in self.scenarios:
+        self.state = "Invalid scenario"
+        self.scenario = self.duration = None
+        return None
+      self.scenario = filename
+      self.duration = float(self.default_duration if self.scenarios is None
+                            else self.scenarios[filename])
+      self._reset()
+      return None
+    if name == "TR":
+      if self.state in ("Arming", "Running", "Paused"):
+        raise _CommandError("Cannot set trigger while running.")
+      self.trigger_mode = int(cmd[1])
+      return None
+    if name == "RU":
+      if self.state != "Initialised":
+        raise _CommandError("No scenario initialised.")
+      if self.trigger_mode:
+        self.state = "Arming"
+      else:
+        self._start()
+      return None
+    if name == "RW":
+      if self.state != "Ended":
+        raise _CommandError("Scenario has not ended.")
+      self._reset()
+      return None
+    if name == "HARDWARE_ON":
+      self.hardware = bool(int(cmd[1]))
+      return None
+    if name == "POPUPS_ON":
+      self.popups = bool(int(cmd[1]))
+      return None
+    raise _CommandError("Unknown command: %s" % name)
+
+  def _apply(self, cmd):
+    name = cmd[1]
+    try:
+      if name == "EN":
+        if self.state not in ("Arming", "Running", "Paused"):
+          raise _CommandError("No scenario running.")
+        self._end(int(cmd[2]))
+      elif name == "PRN_CODE":
+        set_setting(self.prn, int(cmd[2]), int(cmd[3]), bool(int(cmd[4])))
+      else:
+        target, all_chans = int(cmd[4]), int(cmd[6])
+        if name == "POW_ON":
+          set_setting(self.power, target, all_chans, bool(int(cmd[3])))
+        elif name == "POW_MODE":
+          set_setting(self.modes, target, all_chans, int(cmd[3]))
+        else:
+          set_setting(self.levels, target, all_chans,
+                      (float(cmd[3]), bool(int(cmd[7]))))
+    except (IndexError, ValueError):
+      raise _CommandError("Invalid %s command." % name)
+    return None
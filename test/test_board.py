@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the shared-memory status board.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.board import *
+import multiprocessing
+import pytest
+
+def running(host, port, cmd):
+  if cmd == ["TIME"]:
+    return CommandResponse("Running", "42")
+  return CommandResponse("Running", None)
+
+def failing(host, port, cmd):
+  raise RuntimeError("STR4500 returned error: bad")
+
+def read_state(path, host, port, out):
+  out.put(StatusBoard(path).find(host, port).state)
+
+def test_board(tmpdir):
+  path = str(tmpdir.join("str4500.board"))
+  board = StatusBoard(path, slots=4, create=True)
+  poller = BoardPoller(STR4500("sim", 1, handler=running), board)
+  poller.poll()
+  reader = StatusBoard(path)
+  entry = reader.find("sim", 1)
+  assert (entry.state, entry.run_time, entry.error) == ("Running", 42, None)
+  assert entry.latency >= 0 and entry.age() < 1
+  assert reader.read(poller.slot + 1) is None
+  out = multiprocessing.Queue()
+  p = multiprocessing.Process(target=read_state, args=(path, "sim", 1, out))
+  p.start()
+  assert out.get(timeout=5) == "Running"
+  p.join()
+  poller.dev.handler = failing
+  poller.poll()
+  entry = reader.find("sim", 1)
+  assert entry.state == "Running"
+  assert entry.error == "RuntimeError: STR4500 returned error: bad"
+  assert BoardPoller(STR4500("sim", 1, handler=running), board).slot \
+    == poller.slot
+  for port in xrange(2, 5):
+    board.claim("sim", port)
+  with pytest.raises(RuntimeError):
+    board.claim("sim", 5)
+  corrupt = tmpdir.join("corrupt")
+  corrupt.write("x" * 1024)
+  with pytest.raises(RuntimeError):
+    StatusBoard(str(corrupt))
+
+class InterleavedSlot(object):
+  """
+  Stands in for SLOT: the first copy of a slot races a complete write,
+  returning the old fields with the new run time.
+  """
+
+  def __init__(self, slot, write):
+    self.slot = slot
+    self.write = write
+    self.size = slot.size
+
+  def pack_into(self, *args):
+    self.slot.pack_into(*args)
+
+  def unpack_from(self, buf, offset):
+    old = self.slot.unpack_from(buf, offset)
+    if self.write is None:
+      return old
+    write, self.write = self.write, None
+    write()
+    new = self.slot.unpack_from(buf, offset)
+    return old[:4] + new[4:5] + old[5:]
+
+def test_board_torn_read(tmpdir, monkeypatch):
+  """
+  A reader retries when a write lands between its two seq reads.
+  """
+  import pySTR4500.board as board_module
+  board = StatusBoard(str(tmpdir.join("board")), slots=2, create=True)
+  board.write(0, "10.0.0.1", SIMPLEX_PORT, "Running", 10.0)
+  monkeypatch.setattr(board_module, "SLOT", InterleavedSlot(
+    SLOT, lambda: board.write(0, "10.0.0.1", SIMPLEX_PORT, "Ended", 20.0)))
+  entry = board.read(0)
+  assert (entry.state, entry.run_time) == ("Ended", 20.0)
+  board.close()
+
+def test_board_unicode(tmpdir):
+  """
+  Long non-ASCII hosts and errors are cut on character boundaries.
+  """
+  board = StatusBoard(str(tmpdir.join("board")), slots=2, create=True)
+  board.write(0, u"h\xe9" * 40, SIMPLEX_PORT, error=u"x" + u"\xe9" * 100)
+  entry = board.read(0)
+  assert entry.host == (u"h\xe9" * 40)[:43]
+  assert entry.error == u"x" + u"\xe9" * 63
+  poller = BoardPoller(STR4500("sim", 1, handler=running), board)
+  def failing(host, port, cmd):
+    raise RuntimeError("caf\xc3\xa9 \xff")
+  poller.dev.handler = failing
+  poller.poll()
+  assert board.find("sim", 1).error == u"RuntimeError: caf\xe9 \ufffd"
+  board.close()
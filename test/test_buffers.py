@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the in-place receive path.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.buffers import *
+from .test_client import setup_mock_server
+import pytest
+
+class ChunkedSocket(object):
+  """
+  Socket stand-in that returns a reply a few bytes at a time.
+  """
+
+  def __init__(self, reply, chunk=7):
+    self.reply = reply
+    self.chunk = chunk
+
+  def recv_into(self, view):
+    n = min(self.chunk, len(self.reply), len(view))
+    view[:n] = self.reply[:n]
+    self.reply = self.reply[n:]
+    return n
+
+def parse(reply, size=BUFFER_SIZE):
+  return ReceiveBuffer(size).recv(ChunkedSocket(reply))
+
+def test_view_parsing():
+  """
+  Views agree with CommandResponse.fromstring.
+  """
+  for code, status in STATUS_VALUES.iteritems():
+    reply = "<msg><status>%d</status></msg>" % code
+    assert parse(reply) == CommandResponse.fromstring(reply)
+  for reply in ["<msg><status>4</status><data>3600</data></msg>",
+                "<msg><status>2</status><data>0 01:00</data></msg>",
+                "<msg><status>2</status><data>a &amp; b</data></msg>",
+                "<msg><status>2</status><data></data></msg>",
+                ""]:
+    assert parse(reply, size=16) == CommandResponse.fromstring(reply)
+  with pytest.raises(RuntimeError):
+    parse("<msg><status>10</status></msg>")
+  with pytest.raises(RuntimeError):
+    parse("<msg><status>0</status><error>ERROR</error></msg>")
+  with pytest.raises(RuntimeError):
+    parse("<msg><data>1</data></msg>")
+
+def test_view_reuse():
+  buf = ReceiveBuffer()
+  first = buf.recv(ChunkedSocket("<msg><status>4</status><data>1</data></msg>"))
+  frozen = first.freeze()
+  second = buf.recv(ChunkedSocket("<msg><status>4</status><data>2</data></msg>"))
+  buf.recv(ChunkedSocket("<msg><status>4</status><data>3</data></msg>"))
+  assert frozen == CommandResponse("Running", "1")
+  assert CommandResponse("Running", "1") == frozen
+  assert first == CommandResponse("Running", "1")
+  assert CommandResponse("Running", "1") == first
+  assert CommandResponse("Running", "2") != first
+  assert first.data == "1"
+  assert second.status == "Running"
+  with pytest.raises(RuntimeError):
+    second.data
+
+def test_handle_view():
+  ip, port = setup_mock_server()
+  dev = STR4500(ip, port, handler=handle_view)
+  assert dev.status() == CommandResponse("Invalid scenario", "NULL")
+  assert dev.chan.set_prn(3, on=True) \
+    == CommandResponse("Invalid scenario", "-,PRN_CODE,3,0,1")
+  assert dev.scenario_duration() == "SC_DURATION"
+
+def test_handle_view_routing():
+  """
+  Registered transports and the command log see handle_view commands.
+  """
+  from pySTR4500.virtual import VirtualDevice
+  device = VirtualDevice()
+  device.attach("virtual", 2)
+  records = []
+  class ListLog(object):
+    def record(self, **fields):
+      records.append(fields)
+  try:
+    assert handle_view("virtual", 2, ["NULL"]) \
+      == CommandResponse("No scenario specified", None)
+    ip, port = setup_mock_server()
+    set_command_log(ListLog())
+    assert handle_view(ip, port, ["NULL"]) \
+      == CommandResponse("Invalid scenario", "NULL")
+  finally:
+    set_command_log(None)
+    device.detach("virtual", 2)
+  assert [r['mnemonic'] for r in records] == ["NULL"]
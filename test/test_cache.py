@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the shared query cache.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.cache import *
+import threading
+import time
+
+class CountingHandler(object):
+  """
+  Handler stand-in for a Running scenario, counting round-trips.
+  """
+
+  def __init__(self, delay=0.0):
+    self.delay = delay
+    self.calls = []
+    self.lock = threading.Lock()
+
+  def __call__(self, host, port, cmd):
+    with self.lock:
+      self.calls.append(mnemonic(cmd))
+    time.sleep(self.delay)
+    if cmd == ["TIME"]:
+      return CommandResponse("Running", "100")
+    if cmd == ["SC_DURATION"]:
+      return CommandResponse("Running", "0 01:00")
+    return CommandResponse("Running", None)
+
+def test_cache_hits_and_invalidation():
+  handler = CountingHandler()
+  cache = QueryCache(handler, time_ttl=10.0)
+  dev = STR4500("sim", 1, handler=cache.handle)
+  for _ in xrange(5):
+    assert dev.status() == CommandResponse("Running", None)
+    assert dev.scenario_duration() == "0 01:00"
+    assert dev.time() >= 100
+  assert handler.calls == ["NULL", "SC_DURATION", "TIME"]
+  dev.set_power_level(level=1.0, absolute=True)
+  dev.status()
+  assert handler.calls[-1] == "POW_LEV"
+  dev.end_scenario()
+  dev.status()
+  dev.scenario_duration()
+  assert handler.calls[-2:] == ["EN", "NULL"]
+  dev.select_scenario("C:\\my.sim")
+  dev.scenario_duration()
+  assert handler.calls[-2:] == ["SC", "SC_DURATION"]
+  stats = cache.stats()
+  assert stats['misses'] == 5
+  assert stats['hits'] == 15
+
+def test_time_extrapolation():
+  handler = CountingHandler()
+  cache = QueryCache(handler, time_ttl=10.0)
+  dev = STR4500("sim", 1, handler=cache.handle)
+  assert dev.time() == 100
+  cache._entries[("sim", 1, "TIME")] = \
+    (CommandResponse("Running", "100"), time.time() - 2.5)
+  assert dev.time() == 102
+  assert handler.calls.count("TIME") == 1
+
+def test_coalescing():
+  handler = CountingHandler(delay=0.1)
+  cache = QueryCache(handler)
+  results = []
+  def poll():
+    results.append(cache.handle("sim", 1, ["TIME"]))
+  threads = [threading.Thread(target=poll) for _ in xrange(8)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  assert handler.calls == ["TIME"]
+  assert results == [CommandResponse("Running", "100")] * 8
+  assert cache.stats()['coalesced'] == 7
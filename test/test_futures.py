@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the non-blocking futures API.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.futures import *
+from .test_client import setup_mock_server
+import pytest
+import threading
+
+def test_async_echo():
+  """
+  Futures resolve to the same responses as the blocking API, in order.
+  """
+  ip, port = setup_mock_server()
+  with CommandExecutor() as executor:
+    dev = AsyncSTR4500(ip, port, executor)
+    assert dev.connected
+    tr_obj = lambda data: CommandResponse("Invalid scenario", data)
+    futures = [dev.chan.set_power_level(chan, level=-1.0, absolute=False)
+               for chan in xrange(0, 12)]
+    duration = dev.scenario_duration()
+    assert isinstance(duration, CommandFuture)
+    assert duration.result(1) == "SC_DURATION"
+    assert all(f.done() for f in futures)
+    for chan, f in enumerate(futures):
+      assert f.result() == tr_obj("-,POW_LEV,v1_a1,-1.0,%s,1,0,0" % chan)
+    with pytest.raises(ValueError):
+      dev.time().result(1)
+
+def test_order_and_errors():
+  issued = []
+  lock = threading.Lock()
+  def handler(host, port, cmd):
+    with lock:
+      issued.append((host, cmd[0]))
+    if cmd[0] == "bad":
+      raise RuntimeError("STR4500 returned error: bad")
+    return CommandResponse("Running", cmd[0])
+  executor = CommandExecutor(handler)
+  a = [executor.handle("a", 1, [str(i)]) for i in xrange(50)]
+  b = executor.handle("b", 1, ["bad"])
+  assert isinstance(b.exception(1), RuntimeError)
+  with pytest.raises(RuntimeError):
+    b.result()
+  executor.close()
+  assert [cmd for host, cmd in issued if host == "a"] == map(str, xrange(50))
+  assert a[-1].then(lambda r: int(r.data)).result() == 49
+  with pytest.raises(RuntimeError):
+    executor.handle("a", 1, ["NULL"])
+
+def test_callback_errors():
+  """
+  A raising done-callback does not stop the host's I/O thread.
+  """
+  executor = CommandExecutor(lambda host, port, cmd:
+                             CommandResponse("Running", cmd[0]))
+  def fail(future):
+    raise ValueError("callback")
+  first = executor.handle("a", 1, ["1"])
+  first.add_done_callback(fail)
+  first.then(fail)
+  assert executor.handle("a", 1, ["2"]).result(1).data == "2"
+  first.add_done_callback(fail)
+  assert isinstance(first.then(fail).exception(1), ValueError)
+  executor.close()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the crash-safe command journal.
+"""
+
+import json
+import os
+
+from pySTR4500.client import *
+from pySTR4500.journal import *
+from pySTR4500.virtual import VirtualDevice
+
+def drive(dev):
+  dev.select_scenario("C:\\my.sim")
+  dev.set_power(on=True)
+  dev.set_power_level(level=-2.0, absolute=False)
+  dev.run_scenario()
+  for chan in xrange(0, 12):
+    dev.chan.set_power_level(chan, level=float(-chan), absolute=True)
+  dev.chan.set_prn(3, on=False)
+  dev.sat.set_power_level(9, 1.5, absolute=False, timestamp="0 00:10:00")
+  dev.time()
+
+def test_journal_recovery(tmpdir):
+  """
+  A new journal recovers the state left by one that was never closed.
+  """
+  device = VirtualDevice()
+  device.attach("virtual", 3)
+  try:
+    journal = CommandJournal(str(tmpdir), snapshot_every=5)
+    dev = STR4500("virtual", 3, handler=journal.handle)
+    drive(dev)
+    journal.sync()
+    expected = journal.state("virtual", 3)
+    assert expected.scenario == "C:\\my.sim"
+    assert expected.status == "Running"
+    assert expected.levels["4"] == [-4.0, True]
+    assert expected.prn == {"3" : False}
+    assert len(expected.scheduled) == 1
+    # Simulate a torn write after a crash.
+    with open(str(tmpdir.join("virtual_3.journal")), "a") as f:
+      f.write('{"seq":99,"cmd":["-","POW_')
+    with CommandJournal(str(tmpdir)) as restarted:
+      recovered = restarted.state("virtual", 3)
+    assert recovered == expected
+    assert recovered.commands()[0] == ["-", "POW_ON", "v1_a1", 1, 0, 1, 1]
+    assert ["-", "POW_LEV", "v1_a1", -11.0, 11, 1, 0, 1] \
+      in recovered.commands()
+    assert len(tmpdir.join("virtual_3.journal").readlines()) < 5
+  finally:
+    journal.close()
+    device.detach("virtual", 3)
+
+def crash(directory, port, commands):
+  """
+  Issue commands through a new journal, then leave a torn tail as if
+  the process died mid-write.
+  """
+  journal = CommandJournal(directory)
+  try:
+    commands(STR4500("virtual", port, handler=journal.handle))
+    journal.sync()
+    with open(os.path.join(directory, "virtual_%d.journal" % port), "a") as f:
+      f.write('{"seq":99,"cmd":["-","POW_')
+    return journal.state("virtual", port)
+  finally:
+    journal._closed.set()
+    journal._thread.join()
+
+def test_journal_repeated_crashes(tmpdir):
+  """
+  Records acknowledged after recovering from a torn tail survive the
+  next crash too.
+  """
+  device = VirtualDevice()
+  device.attach("virtual", 6)
+  try:
+    def first(dev):
+      dev.select_scenario("C:\\my.sim")
+      dev.run_scenario()
+      dev.chan.set_power_level(1, -3.0, True)
+    def second(dev):
+      dev.chan.set_power_level(2, -6.0, True)
+      dev.chan.set_prn(5, on=False)
+    crash(str(tmpdir), 6, first)
+    expected = crash(str(tmpdir), 6, second)
+    assert expected.levels == {"1" : [-3.0, True], "2" : [-6.0, True]}
+    state, seq = recover(str(tmpdir), "virtual", 6)
+    assert state == expected and seq == 5
+    with CommandJournal(str(tmpdir)) as journal:
+      assert journal.state("virtual", 6) == expected
+    for line in tmpdir.join("virtual_6.journal").readlines():
+      assert line.endswith("\n") and '"seq":99' not in line
+  finally:
+    device.detach("virtual", 6)
+
+def test_replay_state():
+  """
+  State reduction matches the virtual device.
+  """
+  device = VirtualDevice()
+  device.attach("virtual", 4)
+  state = DeviceState()
+  def handler(host, port, cmd):
+    response = handle(host, port, cmd)
+    state.apply(cmd, response.status)
+    return response
+  try:
+    drive(STR4500("virtual", 4, handler=handler))
+    for chan in xrange(0, 12):
+      assert tuple(state.levels[str(chan)]) == device.level(chan)
+    dev = STR4500("virtual", 4, handler=handler)
+    dev.end_scenario(stop_mode=1)
+    assert state.levels == {} and state.status == "Initialised"
+  finally:
+    device.detach("virtual", 4)
+
+def test_journal_scheduled(tmpdir, monkeypatch):
+  """
+  Timestamped commands that have fired are folded into the recovered
+  state and snapshots, and only future ones are re-issued.
+  """
+  import pySTR4500.journal as journal_module
+  synced = []
+  monkeypatch.setattr(journal_module, "_fsync_directory", synced.append)
+  device = VirtualDevice()
+  device.attach("virtual", 7)
+  try:
+    with CommandJournal(str(tmpdir), snapshot_every=13) as journal:
+      dev = STR4500("virtual", 7, handler=journal.handle)
+      dev.select_scenario("C:\\my.sim")
+      dev.run_scenario()
+      for chan in xrange(0, 10):
+        dev.chan.set_power_level(chan, float(-chan), True,
+                                 timestamp=format_timestamp(10 * (chan + 1)))
+      device.advance(55)
+      dev.chan.set_prn(3, on=False)
+      state = journal.state("virtual", 7)
+      assert sorted(state.levels) == ["0", "1", "2", "3", "4"]
+      assert state.levels["4"] == [-4.0, True]
+      assert len(state.scheduled) == 5
+      assert state.commands()[-5:] == state.scheduled
+      assert state.commands()[-1][:2] == ["0 00:01:40", "POW_LEV"]
+      # The 13th record, after the clock moved, wrote a resolved snapshot.
+      with open(str(tmpdir.join("virtual_7.snapshot"))) as f:
+        snapshot = json.load(f)['state']
+      assert len(snapshot['scheduled']) == 5 and len(snapshot['levels']) == 5
+      assert synced == [str(tmpdir)]
+      dev.end_scenario(stop_mode=0)
+      assert journal.state("virtual", 7).scheduled == []
+  finally:
+    device.detach("virtual", 7)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the load-test harness, against its stand-in server.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.loadtest import *
+import pytest
+
+def test_commands():
+  rand = random.Random(0)
+  assert mnemonic(command("POW_LEV", rand)) == "POW_LEV"
+  assert mnemonic(command("PRN_CODE", rand)) == "PRN_CODE"
+  assert mnemonic(command("query", rand)) in ("NULL", "TIME", "SC_DURATION")
+  with pytest.raises(ValueError):
+    command("RU")
+
+def test_ramp_knee():
+  """
+  A stand-in capped at 50 commands/s saturates once concurrency exceeds
+  one.
+  """
+  server = StandInServer(service_time=0.02)
+  host, port = server.server_address
+  try:
+    results = run_ramp(host, port, ramp=(1, 2, 4), duration=0.4, seed=0)
+  finally:
+    server.close()
+  assert [r.concurrency for r in results] == [1, 2, 4]
+  assert all(r.errors == 0 for r in results)
+  assert all(r.throughput() <= 55 for r in results)
+  assert results[2].percentile(50) > results[0].percentile(50)
+  knee = find_knee(results)
+  assert knee in (1, 2)
+  assert "sustainable rate" in format_report(results, knee)
+
+def test_errors():
+  results = [run_step("127.0.0.1", 1, 1, 0.05)]
+  assert results[0].error_rate() == 1.0
+  assert find_knee(results) == 0
+
+def test_invalid_mix():
+  """
+  Bad mixes are rejected before any workers start.
+  """
+  for mix in ({"pow_lev" : 1}, {}, {"query" : 0}, {"query" : -1}):
+    with pytest.raises(ValueError):
+      run_step("127.0.0.1", 1, 1, 0.05, mix)
+  for mix in ("pow_lev=1", "query=0", "query"):
+    with pytest.raises(SystemExit):
+      main(["--mix", mix, "--duration", "0"])
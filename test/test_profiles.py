@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the power profile compiler.
+"""
+
+import pytest
+np = pytest.importorskip("numpy")
+
+from pySTR4500.client import *
+from pySTR4500.profiles import *
+
+def test_timestamps():
+  assert format_timestamp(0) == "0 00:00:00"
+  assert format_timestamp(300) == "0 00:05:00"
+  assert format_timestamp(90061.25) == "1 01:01:01.250"
+  assert parse_timestamp("1 01:01:01.250") == 90061.25
+  assert parse_timestamp("-") is None
+  with pytest.raises(ValueError):
+    parse_timestamp("00:05:00")
+
+def test_compile_profile():
+  """
+  Quantize, drop sub-threshold changes and merge uniform updates.
+  """
+  times = np.arange(6) * 0.1
+  levels = np.array([[0.0, 0.0],
+                     [0.1, 0.0],
+                     [-3.0, 0.2],
+                     [-3.1, -0.2],
+                     [-5.0, -5.0],
+                     [-5.1, -4.9]])
+  profile = compile_profile(times, levels, [3, 17], step=0.5)
+  assert profile.commands == [
+    ["0 00:00:00", "POW_LEV", "v1_a1", 0.0, 0, 1, 1, 0],
+    ["0 00:00:00.200", "POW_LEV", "v1_a1", -3.0, 3, 1, 0, 0],
+    ["0 00:00:00.400", "POW_LEV", "v1_a1", -5.0, 0, 1, 1, 0]]
+  assert profile.samples == 12
+  assert profile.ratio() == 4.0
+  assert abs(profile.max_error - 0.2) < 1e-9
+  unmerged = compile_profile(times, levels, [3, 17], step=0.5, merge=False)
+  assert len(unmerged.commands) == 5
+  assert encode(unmerged.commands[-1]) == "0 00:00:00.400,POW_LEV,v1_a1," \
+                                          "-5.0,17,1,0,0"
+
+def test_compile_profile_threshold():
+  times = np.arange(100) * 0.01
+  levels = np.linspace(0.0, -9.9, 100)
+  profile = compile_profile(times, levels, [5], step=0.1, threshold=1.0,
+                            absolute=True)
+  assert len(profile.commands) == 10
+  assert all(cmd[4] == 5 and cmd[-1] == 1 for cmd in profile.commands)
+  assert profile.max_error < 1.0
+  with pytest.raises(ValueError):
+    compile_profile(times, levels, [33])
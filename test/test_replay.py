@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for streaming C/N0 log replay.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.replay import *
+import time
+
+class RecordingHandler(object):
+  """
+  Handler stand-in recording (wall time, command), delay seconds each.
+  """
+
+  def __init__(self, delay=0.0):
+    self.delay = delay
+    self.calls = []
+
+  def __call__(self, host, port, cmd):
+    time.sleep(self.delay)
+    self.calls.append((time.time(), cmd))
+    return CommandResponse("Running", None)
+
+def write_log(tmpdir, rows):
+  path = tmpdir.join("cn0.csv")
+  path.write("time,prn,cn0\n" + "".join("%s,%s,%s\n" % r for r in rows))
+  return str(path)
+
+def test_power_levels(tmpdir):
+  path = write_log(tmpdir, [(0.0, 1, 45.0), (0.0, 40, 30.0), (0.1, 1, 45.0),
+                            (0.2, 1, 41.5), (0.2, 2, 47.0)])
+  stats = ReplayStats()
+  levels = list(power_levels(read_cn0_log(path), stats=stats))
+  assert levels == [(0.0, 1, 0.0), (0.2, 1, -3.5), (0.2, 2, 2.0)]
+  assert (stats.records, stats.skipped) == (5, 1)
+  levels = list(power_levels(read_cn0_log(path), reference={2 : 40.0},
+                             prn_map={2 : 12}))
+  assert levels == [(0.2, 12, 7.0)]
+
+def test_replay_pacing(tmpdir):
+  path = write_log(tmpdir, [(10.0 + 0.05 * i, 1 + i % 2, 40.0 + i)
+                            for i in xrange(6)])
+  handler = RecordingHandler()
+  dev = STR4500("sim", 1, handler=handler)
+  handler.calls = []
+  t0 = time.time()
+  stats = replay(dev, path, clock=lambda: time.time() - t0, start=0.1)
+  assert stats.sent == 6
+  for i, (sent, cmd) in enumerate(handler.calls):
+    assert cmd == ["-", "POW_LEV", "v1_a1", -5.0 + i, 1 + i % 2, 1, 0, 0]
+    assert sent - t0 >= 0.1 + 0.05 * i - 0.01
+
+def test_replay_backpressure(tmpdir):
+  """
+  A slow command path coalesces overdue updates instead of queueing.
+  """
+  path = write_log(tmpdir, [(0.01 * i, 1 + i % 2, 40.0 + i)
+                            for i in xrange(100)])
+  handler = RecordingHandler(delay=0.05)
+  dev = STR4500("sim", 1, handler=handler)
+  handler.calls = []
+  t0 = time.time()
+  stats = replay(dev, path, clock=lambda: time.time() - t0, start=0.0,
+                 max_pending=4)
+  assert stats.records == 100
+  assert stats.sent < 50
+  assert stats.coalesced > 0
+  assert handler.calls[-1][1][3] == 40.0 + 99 - 45.0
+
+class TruncatingDevice(object):
+  """
+  Device whose time() truncates a run clock that started at t0 + 0.9 s.
+  """
+
+  def __init__(self):
+    self.t0 = time.time() - 0.9
+
+  def time(self):
+    return int(time.time() - self.t0)
+
+def test_sim_clock_monotonic():
+  """
+  Re-polling truncated times never moves the clock backwards.
+  """
+  dev = TruncatingDevice()
+  clock = SimClock(dev, poll_interval=0.01)
+  last, end = clock(), time.time() + 0.3
+  while time.time() < end:
+    t = clock()
+    assert t >= last
+    assert time.time() - dev.t0 - 1.0 <= t <= time.time() - dev.t0 + 0.05
+    last = t
+    time.sleep(0.002)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the columnar command result store.
+"""
+
+import pytest
+np = pytest.importorskip("numpy")
+
+from pySTR4500.client import *
+from pySTR4500.results import *
+from pySTR4500.virtual import VirtualDevice
+
+def sweep(dev):
+  dev.select_scenario("C:\\my.sim")
+  dev.run_scenario()
+  for level in xrange(0, 20):
+    for chan in xrange(0, 12):
+      dev.chan.set_power_level(chan, level=float(-level), absolute=False)
+  dev.sat.set_power_level(7, 1.5, False, timestamp="0 00:10:00")
+  dev.time()
+
+def test_results_store():
+  """
+  Records grow the store and summarise by mnemonic, target and status.
+  """
+  device = VirtualDevice()
+  device.attach("virtual", 5)
+  try:
+    results = ResultStore(capacity=16)
+    sweep(STR4500("virtual", 5, handler=results.handle))
+    assert len(results) == 245
+    assert results.capacity() == 256
+    assert results.array().dtype.itemsize == 29
+    assert results.counts() == {"NULL" : 1, "SC" : 1, "RU" : 1,
+                                "POW_LEV" : 241, "TIME" : 1}
+    assert results.status_counts() == {"No scenario specified" : 1,
+                                       "Initialised" : 1, "Running" : 243}
+    t, levels = results.levels(3)
+    assert len(t) == 20 and list(levels) == [-float(l) for l in xrange(20)]
+    scheduled = results.select("POW_LEV", 7)[-1]
+    assert scheduled['timestamp'] == 600.0 and scheduled['level'] == 1.5
+    summary = results.summary()
+    assert summary["POW_LEV"]['count'] == 241
+    assert summary["POW_LEV"]['errors'] == 0
+    assert results.latency_percentiles()[99] >= 0
+  finally:
+    device.detach("virtual", 5)
+
+def test_results_errors():
+  def handler(host, port, cmd):
+    raise RuntimeError("Invalid STR4500 status.")
+  results = ResultStore(handler=handler)
+  with pytest.raises(RuntimeError):
+    STR4500(handler=handler).status()
+  with pytest.raises(RuntimeError):
+    results.handle("localhost", SIMPLEX_PORT, ["NULL"])
+  results.append(["RU"], "Running")
+  assert len(results.errors()) == 1
+  assert len(results.select(status=None)) == 1
+  assert len(results.select(status="Running")) == 1
+  assert results.status_counts() == {None : 1, "Running" : 1}
+
+def test_results_spill(tmpdir):
+  """
+  A file-backed store can be reloaded after close.
+  """
+  path = str(tmpdir.join("campaign.results"))
+  with ResultStore(capacity=4, path=path) as results:
+    for i in xrange(100):
+      results.append(["-", "POW_LEV", VEHICLE_ANTENNA, -0.5 * i, i % 12, 1,
+                      0, 0], "Running", 0.001 * i, t=float(i))
+    assert isinstance(results.array(), np.memmap)
+  assert tmpdir.join("campaign.results").size() == 100 * 29
+  loaded = ResultStore.load(path)
+  assert len(loaded) == 100
+  assert loaded.counts() == {"POW_LEV" : 100}
+  t, levels = loaded.levels(5)
+  assert list(t) == [5.0, 17.0, 29.0, 41.0, 53.0, 65.0, 77.0, 89.0]
+  assert levels[1] == -8.5
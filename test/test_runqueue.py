@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for pre-armed back-to-back scenario runs.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.runqueue import *
+import pytest
+import socket
+import threading
+import time
+
+class FakeDevice(object):
+  """
+  SimPLEX state machine stand-in whose scenarios take load_time to
+  select.
+  """
+
+  def __init__(self, load_time=0.1):
+    self.load_time = load_time
+    self.state = "No scenario specified"
+    self.loaded = None
+    self.log = []
+    self.lock = threading.Lock()
+
+  def _loading(self):
+    return self.loaded is not None and time.time() < self.loaded
+
+  def status(self):
+    with self.lock:
+      if self.state == "Arming" and not self._loading():
+        self.state = "Initialised"
+      return CommandResponse(self.state, None)
+
+  def select_scenario(self, filename):
+    with self.lock:
+      self.log.append(("SC", filename))
+      if "invalid" in filename:
+        self.state = "Invalid scenario"
+      else:
+        self.state = "Arming"
+        self.loaded = time.time() + self.load_time
+
+  def rewind_scenario(self):
+    with self.lock:
+      self.log.append(("RW",))
+      self.state = "Initialised"
+
+  def run_scenario(self):
+    with self.lock:
+      assert self.state == "Initialised"
+      self.log.append(("RU",))
+      self.state = "Running"
+
+  def end_scenario(self):
+    with self.lock:
+      self.state = "Ended"
+
+def test_prearm():
+  """
+  The next scenario loads while the caller is busy after a run.
+  """
+  dev = FakeDevice(load_time=0.2)
+  with RunQueue(dev, ["a.sim", "invalid.sim", "b.sim"],
+                poll_interval=0.01) as runs:
+    assert runs.start_next(timeout=5) == "a.sim"
+    time.sleep(0.05)
+    dev.end_scenario()
+    # Collect results for longer than a scenario takes to load.
+    time.sleep(0.5)
+    assert runs.armed() == "b.sim"
+    start = time.time()
+    assert runs.start_next(timeout=5) == "b.sim"
+    assert time.time() - start < 0.1
+    assert runs.pending() == 0
+    with pytest.raises(RuntimeError):
+      runs.start_next(timeout=1)
+  assert [f for f, _ in runs.failed] == ["invalid.sim"]
+  assert dev.log == [("SC", "a.sim"), ("RU",), ("RW",), ("SC", "invalid.sim"),
+                     ("SC", "b.sim"), ("RU",)]
+
+class FlakyDevice(FakeDevice):
+  """
+  FakeDevice whose first run_scenario times out.
+  """
+
+  def __init__(self, *args, **kwargs):
+    FakeDevice.__init__(self, *args, **kwargs)
+    self.failures = 1
+
+  def run_scenario(self):
+    if self.failures:
+      self.failures -= 1
+      raise socket.timeout("timed out")
+    FakeDevice.run_scenario(self)
+
+def test_start_failure():
+  """
+  A scenario that fails to start stays armed, and later ones still arm.
+  """
+  dev = FlakyDevice(load_time=0.05)
+  with RunQueue(dev, ["a.sim", "b.sim"], poll_interval=0.01) as runs:
+    with pytest.raises(socket.timeout):
+      runs.start_next(timeout=5)
+    assert runs.armed() == "a.sim" and runs.pending() == 2
+    assert runs.start_next(timeout=5) == "a.sim"
+    dev.end_scenario()
+    assert runs.start_next(timeout=5) == "b.sim"
+  assert runs.failed == []
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the priority-aware rate-limited scheduler.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.scheduler import *
+from .test_client import setup_mock_server
+import pytest
+import threading
+import time
+
+def test_priority_order():
+  """
+  Control commands and queries preempt queued power updates.
+  """
+  issued = []
+  gate = threading.Event()
+  def handler(host, port, cmd):
+    gate.wait()
+    issued.append(mnemonic(cmd))
+    return CommandResponse("Running", None)
+  with CommandScheduler(rate=1000.0, handler=handler) as scheduler:
+    first = scheduler.submit("sim", 1, ["-", "POW_LEV", "v1_a1", 1.0, 0, 1, 1,
+                                        1])
+    time.sleep(0.05)
+    bulk = [scheduler.submit("sim", 1, ["-", "POW_LEV", "v1_a1", 1.0, 0, 1, 1,
+                                        1]) for _ in xrange(5)]
+    query = scheduler.submit("sim", 1, ["NULL"])
+    control = scheduler.submit("sim", 1, ["-", "EN", 0, 0])
+    gate.set()
+    assert control.result(1) == CommandResponse("Running", None)
+    for future in [first, query] + bulk:
+      future.result(1)
+  assert issued == ["POW_LEV", "EN", "NULL"] + ["POW_LEV"] * 5
+
+def test_rate_limit():
+  ip, port = setup_mock_server()
+  with CommandScheduler(rate=50.0) as scheduler:
+    dev = STR4500(ip, port, handler=scheduler.handle)
+    start = time.time()
+    for power in xrange(10):
+      assert dev.chan.set_power_level(1, level=float(power), absolute=True) \
+        == CommandResponse("Invalid scenario",
+                           "-,POW_LEV,v1_a1,%s,1,1,0,1" % float(power))
+    assert time.time() - start >= 9 / 50.0
+
+def test_errors():
+  def handler(host, port, cmd):
+    raise RuntimeError("STR4500 returned error: bad")
+  with CommandScheduler(handler=handler) as scheduler:
+    with pytest.raises(RuntimeError):
+      scheduler.handle("sim", 1, ["NULL"])
+  with pytest.raises(ValueError):
+    TokenBucket(0)
+
+def test_callback_errors():
+  """
+  A raising done-callback does not stop the host's dispatcher.
+  """
+  gate = threading.Event()
+  def handler(host, port, cmd):
+    gate.wait()
+    return CommandResponse("Running", None)
+  def fail(future):
+    raise ValueError("callback")
+  with CommandScheduler(rate=1000.0, handler=handler) as scheduler:
+    scheduler.submit("sim", 1, ["NULL"]).add_done_callback(fail)
+    gate.set()
+    assert scheduler.submit("sim", 1, ["NULL"]).result(1) \
+      == CommandResponse("Running", None)
+
+def test_set_rate_and_close():
+  """
+  A dispatcher waiting for a token sees a new rate at once, and a
+  closed scheduler refuses new commands.
+  """
+  def handler(host, port, cmd):
+    return CommandResponse("Running", None)
+  scheduler = CommandScheduler(rate=0.1, handler=handler)
+  scheduler.submit("sim", 1, ["NULL"]).result(1)
+  pending = scheduler.submit("sim", 1, ["NULL"])
+  time.sleep(0.05)
+  scheduler.set_rate("sim", 1, 1000.0)
+  assert pending.result(1) == CommandResponse("Running", None)
+  scheduler.close()
+  with pytest.raises(RuntimeError):
+    scheduler.submit("sim", 1, ["NULL"])
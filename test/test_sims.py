@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for scenario discovery.
+"""
+
+import os
+import shutil
+import time
+
+from pySTR4500.sims import *
+
+def scenarios():
+  """
+  Get the shipped index, less entries that are not scenario files.
+  """
+  return dict((key, val) for key, val in parse_sims_dictionary().iteritems()
+              if val.endswith(SCENARIO_EXTENSION))
+
+def mirror(root, index):
+  """
+  Recreate the scenario tree of an index under root, with mtimes in the
+  past.
+  """
+  for val in index.itervalues():
+    rel = val[len(WINDOWS_ROOT) + 1:].split("\\")
+    path = os.path.join(root, *rel)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    open(path, "w").close()
+  age(root)
+
+def age(root, seconds=60):
+  t = time.time() - seconds
+  for path, _, _ in os.walk(root):
+    os.utime(path, (t, t))
+
+def test_refresh_sims(tmpdir):
+  """
+  Refreshing from a mirror of the shipped index leaves it unchanged,
+  including entries that are not scenario files.
+  """
+  root = str(tmpdir.join("Scenarios"))
+  mirror(root, scenarios())
+  path = str(tmpdir.join("sim_scenarios.txt"))
+  shutil.copy(SIMS_DICTIONARY, path)
+  index = parse_sims_dictionary()
+  assert refresh_sims_dictionary(root, path) == index
+  assert parse_sims_dictionary(path) == index
+  assert len(index) == 69 and index[44].endswith("sim_nmea.txt")
+
+def test_incremental_scan(tmpdir):
+  """
+  Only changed directories are listed again, and keys stay stable.
+  """
+  index = scenarios()
+  root = str(tmpdir.join("Scenarios"))
+  mirror(root, index)
+  cache = str(tmpdir.join("cache.json"))
+  scanner = ScenarioScanner(root, cache=cache)
+  assert len(scanner.scan()) == 68
+  dirs = scanner.listed
+  assert dirs > 68
+  assert scanner.scan() and scanner.listed == 0
+  ship = os.path.join(root, "Ship Scenarios")
+  if not os.path.isdir(ship):
+    os.makedirs(ship)
+  open(os.path.join(ship, "SHIP_NEW.sim"), "w").close()
+  removed = os.path.join(root, *index[2][len(WINDOWS_ROOT) + 1:].split("\\"))
+  os.remove(removed)
+  t = time.time() - 30
+  os.utime(ship, (t, t))
+  os.utime(os.path.dirname(removed), (t, t))
+  # A new process picks up the cached state.
+  scanner = ScenarioScanner(root, cache=cache)
+  path = str(tmpdir.join("sim_scenarios.txt"))
+  shutil.copy(SIMS_DICTIONARY, path)
+  updated = refresh_sims_dictionary(root, path, scanner=scanner)
+  assert scanner.listed == 2
+  assert 2 not in updated and 44 in updated and len(updated) == 69
+  assert updated[max(index) + 1] == WINDOWS_ROOT + \
+    "\\Ship Scenarios\\SHIP_NEW.sim"
+  for key, val in updated.iteritems():
+    assert key not in index or index[key] == val
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the threshold search.
+"""
+
+import pytest
+
+from pySTR4500.client import *
+from pySTR4500.threshold import *
+
+class FakeReceiver(object):
+  """
+  Tracks a satellite while its level stays at or above its threshold,
+  but only acquires it margin dB higher.
+  """
+
+  def __init__(self, thresholds, margin=2.0):
+    self.thresholds = thresholds
+    self.margin = margin
+    self.locked = dict((sat, True) for sat in thresholds)
+    self.commands = 0
+
+  def handle(self, host, port, cmd):
+    if mnemonic(cmd) == "POW_LEV":
+      self.commands += 1
+      level, sat = cmd[3], cmd[4]
+      if level < self.thresholds[sat]:
+        self.locked[sat] = False
+      elif level >= self.thresholds[sat] + self.margin:
+        self.locked[sat] = True
+    return CommandResponse("Running")
+
+  def probe(self, sat, level):
+    return self.locked[sat]
+
+def test_threshold_parallel():
+  """
+  Each satellite's tracking threshold is found in a logarithmic number
+  of probes.
+  """
+  thresholds = {1 : -12.3, 2 : -21.7, 3 : -4.1, 4 : 3.2}
+  receiver = FakeReceiver(thresholds)
+  sat = Satellite("localhost", SIMPLEX_PORT, receiver.handle)
+  results = find_thresholds(sat, sorted(thresholds), receiver.probe,
+                            low=-30.0, high=0.0, resolution=0.25, settle=0)
+  for s, threshold in thresholds.iteritems():
+    result = results[s]
+    assert result.failing < threshold <= result.threshold
+    assert result.threshold - result.failing <= 0.25
+  # 30 dB to 0.25 dB is 7 bisections, plus the bracket probes.
+  assert max(r.steps() for r in results.itervalues()) <= 10
+  assert results[4].history[:2] == [(0.0, False), (30.0, True)]
+
+def test_threshold_hysteresis():
+  """
+  Relocking after failed probes finds the tracking threshold; without
+  it, the result lands somewhere between tracking and acquisition.
+  """
+  receiver = FakeReceiver({7 : -10.0}, margin=2.0)
+  sat = Satellite("localhost", SIMPLEX_PORT, receiver.handle)
+  tracking = find_threshold(sat, 7, receiver.probe, -30.0, 0.0,
+                            resolution=0.1, settle=0)
+  assert abs(tracking.threshold - -10.0) <= 0.1
+  acquisition = find_threshold(sat, 7, receiver.probe, -30.0, 0.0,
+                               resolution=0.1, settle=0, hysteresis=None)
+  assert -10.0 <= acquisition.threshold <= -7.9
+  assert acquisition.threshold - tracking.threshold > 1.0
+
+def test_threshold_out_of_range():
+  receiver = FakeReceiver({5 : 50.0})
+  chan = Channel("localhost", SIMPLEX_PORT, receiver.handle)
+  result = find_threshold(chan, 5, receiver.probe, -10.0, 0.0, settle=0)
+  assert result.threshold is None and result.failing == 40.0
+  with pytest.raises(ValueError):
+    find_threshold(chan, 5, receiver.probe, 0.0, 0.0)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the structured command log and its analyzer.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.timing import *
+from .test_client import setup_mock_server
+
+def test_mnemonic():
+  assert mnemonic(["NULL"]) == "NULL"
+  assert mnemonic(["SC", "C:\\my.sim"]) == "SC"
+  assert mnemonic(["-", "POW_LEV", VEHICLE_ANTENNA, 1.0, 0, 1, 1, 1]) \
+    == "POW_LEV"
+  assert mnemonic(["0 00:05:00", "EN", 2, 0]) == "EN"
+
+def test_command_log(tmpdir):
+  """
+  Commands issued through handle() are logged and analyzable.
+  """
+  ip, port = setup_mock_server()
+  path = str(tmpdir.join("log.jsonl"))
+  log = CommandLog(path)
+  set_command_log(log)
+  try:
+    dev = STR4500(ip, port)
+    dev.set_power_level(level=1.0, absolute=True)
+    dev.time()
+  except ValueError:
+    pass
+  finally:
+    set_command_log(None)
+    log.close()
+  records = list(iter_records([path]))
+  assert [r['mnemonic'] for r in records] == ["NULL", "POW_LEV", "TIME"]
+  assert records[1]['args'] == ["-", "POW_LEV", "v1_a1", "1.0", "0", "1",
+                                "1", "1"]
+  assert all(r['status'] == "Invalid scenario" for r in records)
+  assert all(r['error'] is None for r in records)
+  for r in records:
+    assert r['total'] >= r['connect'] + r['send'] + r['recv'] + r['parse']
+  summary = analyze(records, bucket=60, top=2)
+  assert summary['count'] == 3
+  assert sum(n for _, n, _ in summary['throughput']) == 3
+  assert len(summary['slowest']) == 2
+  assert summary['hosts']["%s:%s" % (ip, port)].count == 3
+  assert "TIME" in format_report(summary, bucket=60)
+
+def test_command_log_errors():
+  ip, port = "127.0.0.1", 1
+  records = []
+  class ListLog(object):
+    def record(self, **fields):
+      records.append(fields)
+  set_command_log(ListLog())
+  try:
+    handle(ip, port, ["NULL"])
+  except Exception:
+    pass
+  finally:
+    set_command_log(None)
+  assert len(records) == 1
+  assert records[0]['status'] is None
+  assert records[0]['error'].startswith("error")
+  summary = analyze(records)
+  assert summary['mnemonics']["NULL"][:2] == [1, 1]
+
+def test_latency_histogram():
+  h = LatencyHistogram()
+  for ms in xrange(1, 1001):
+    h.add(ms / 1000.0)
+  assert h.count == 1000
+  assert abs(h.percentile(50) - 0.5) < 0.05
+  assert abs(h.percentile(99) - 0.99) < 0.1
+  assert h.percentile(100) <= 1.0
+
+def test_command_log_write_errors(tmpdir):
+  """
+  An unwritable path is counted, and close() still returns.
+  """
+  tmpdir.join("file").write("")
+  log = CommandLog(str(tmpdir.join("file", "log.jsonl")), flush_interval=0.01,
+                   max_pending=3)
+  for i in xrange(20):
+    log.record(t=0.0, mnemonic="NULL")
+  log.close()
+  assert log.errors >= 1 and isinstance(log.last_error, EnvironmentError)
+  assert log.errors + log.dropped == 20
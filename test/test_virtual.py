@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright (C) 2014 Swift Navigation Inc.
+# Contact: Bhaskar Mookerji <mookerji@swiftnav.com>
+#
+# This source is subject to the license found in the file 'LICENSE' which must
+# be be distributed together with this source. All other rights reserved.
+#
+# THIS CODE AND INFORMATION IS PROVIDED "AS IS" WITHOUT WARRANTY OF ANY KIND,
+# EITHER EXPRESSED OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND/OR FITNESS FOR A PARTICULAR PURPOSE.
+
+"""
+Tests for the in-process virtual-time device.
+"""
+
+from pySTR4500.client import *
+from pySTR4500.sims import *
+from pySTR4500.virtual import *
+import pytest
+import time
+
+SHIP = parse_sims_dictionary()[30]
+
+def test_virtual_run():
+  """
+  A four hour scenario runs through its state transitions instantly.
+  """
+  device = VirtualDevice({SHIP : 4 * 3600})
+  dev = device.attach("virtual", 1)
+  try:
+    assert dev.status() == CommandResponse("No scenario specified", None)
+    assert dev.select_scenario("C:\\missing.sim").status == "Invalid scenario"
+    assert dev.select_scenario(SHIP).status == "Initialised"
+    assert dev.scenario_duration() == "0 04:00"
+    dev.set_power_level(level=-1.0, absolute=False)
+    dev.sat.set_power_level(7, -3.0, absolute=True,
+                            timestamp=format_timestamp(1800))
+    dev.end_scenario(stop_mode=0, timestamp=format_timestamp(3 * 3600))
+    with pytest.raises(RuntimeError):
+      dev.rewind_scenario()
+    assert dev.run_scenario().status == "Running"
+    device.advance(1799)
+    assert device.level(7) == (-1.0, False)
+    device.advance(1)
+    assert device.level(7) == (-3.0, True)
+    assert dev.time() == 1800
+    device.advance(24 * 3600)
+    assert dev.status().status == "Ended"
+    assert dev.time() == 3 * 3600
+    assert dev.rewind_scenario().status == "Initialised"
+    assert dev.time() == 0
+    assert device.level(7) is None
+    dev.run_scenario()
+    device.advance(5 * 3600)
+    assert (dev.status().status, dev.time()) == ("Ended", 4 * 3600)
+    with pytest.raises(RuntimeError):
+      dev.select_scenario(SHIP)
+    with pytest.raises(RuntimeError):
+      handle("virtual", 1, ["X<&"])
+    assert dev.status().status == "Ended"
+  finally:
+    device.detach("virtual", 1)
+
+def test_virtual_rate_and_trigger():
+  device = VirtualDevice(default_duration=3600.0, rate=3600.0)
+  dev = device.attach("virtual", 2)
+  try:
+    dev.select_scenario("C:\\any.sim")
+    dev.set_trigger(1)
+    assert dev.run_scenario().status == "Arming"
+    time.sleep(0.05)
+    assert dev.time() == 0
+    device.trigger()
+    time.sleep(0.1)
+    assert 300 <= dev.time() < 3600
+    time.sleep(1.0)
+    assert dev.status().status == "Ended"
+    with pytest.raises(RuntimeError):
+      handle("virtual", 2, ["BOGUS"])
+  finally:
+    device.detach("virtual", 2)